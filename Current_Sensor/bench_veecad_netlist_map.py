@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import veecad_netlist_map as vnm
+
+
+# name -> (components, pads per component, distinct footprints, library files, outlines per file)
+SIZES = {
+    "small": (100, 4, 10, 20, 20),
+    "medium": (2000, 8, 60, 200, 30),
+    "large": (20000, 12, 200, 1000, 40),
+}
+
+
+FOOTPRINT_TEMPLATES = [
+    "Package_DIP:DIP-{n}_W7.62mm",
+    "Connector_PinHeader_2.54mm:PinHeader_1x{n:02d}_P2.54mm_Vertical",
+    "Connector_JST:JST_XH_B{n}B-XH-A_1x{n:02d}_P2.50mm_Vertical",
+    "Resistor_THT:R_Axial_DIN0204_L3.6mm_D1.6mm_P{n}.62mm_Horizontal",
+    "Capacitor_THT:C_Disc_D{n}.0mm_W2.5mm_P5.00mm",
+    "Package_TO_SOT_THT:TO-92_Inline_V{n}",
+    "Custom_Lib:Part_{n}_Variant",
+]
+
+
+def generate_netlist(path: str, components: int, pads_per_component: int, footprints: int, seed: int = 0) -> None:
+    """Write a synthetic Eeschema 1.1 netlist with the given shape."""
+    rng = random.Random(seed)
+    fp_names = []
+    for i in range(footprints):
+        template = FOOTPRINT_TEMPLATES[i % len(FOOTPRINT_TEMPLATES)]
+        fp_names.append(template.format(n=i // len(FOOTPRINT_TEMPLATES) + 2))
+    nets = [f"Net-(N{i}-Pad1)" for i in range(max(2, components // 2))] + ["GND", "+5V"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("( { EESchema Netlist Version 1.1 created  2025-01-01T00:00:00+0000 }\n")
+        for c in range(components):
+            uuid = "%08x-%04x-%04x-%04x-%012x" % (
+                rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(16), rng.getrandbits(16), rng.getrandbits(48)
+            )
+            f.write(f" ( /{uuid} {fp_names[c % footprints]}  U{c + 1} VAL{c % 17}\n")
+            for pad in range(1, pads_per_component + 1):
+                f.write(f"  (    {pad} {rng.choice(nets)} )\n")
+            f.write(" )\n")
+        f.write(")\n*\n")
+
+
+def _json_per(outlines) -> str:
+    data = {
+        "CelledOutlines": [
+            {
+                "Name": name,
+                "Rows": [[{"Pin": str(i + 1), "Shape": 1}, {"Shape": 0}] for i in range(pins)],
+                "PinNames": [str(i + 1) for i in range(pins)],
+            }
+            for name, pins in outlines
+        ]
+    }
+    return "VeeCAD Library\n" + json.dumps(data, indent=1) + "\n"
+
+
+def _ini_per(outlines) -> str:
+    lines = ["[Info]", "Version,3", "[Outlines]"]
+    for name, pins in outlines:
+        lines.append(f"{name},{pins}")
+        lines.extend(f"Pin,{i + 1},{i % 2},{i // 2}" for i in range(pins))
+        lines.append("End")
+    lines.append("[Components]")
+    return "\n".join(lines) + "\n"
+
+
+def generate_library(root: str, files: int, outlines_per_file: int, json_ratio: float = 0.5, seed: int = 0) -> None:
+    """Write a synthetic VeeCAD library tree mixing JSON-style and INI-style .per files."""
+    rng = random.Random(seed)
+    common = [f"DIP{n}" for n in range(4, 42, 2)] + [f"SIP{n}" for n in range(1, 21)] + ["TO92", "AX2_1", "CAPR5_5", "BOX1_1"]
+    for i in range(files):
+        sub = os.path.join(root, f"Vendor{i % 10}", f"Group{i % 7}")
+        os.makedirs(sub, exist_ok=True)
+        outlines = []
+        for k in range(outlines_per_file):
+            if rng.random() < 0.1:
+                name = rng.choice(common)
+            else:
+                name = f"OL{i}_{k}"
+            outlines.append((name, rng.randint(1, 40)))
+        text = _json_per(outlines) if rng.random() < json_ratio else _ini_per(outlines)
+        with open(os.path.join(sub, f"V_Lib{i}.per"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def _time(fn, repeat: int) -> dict:
+    runs = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - t0)
+    return {"min_s": min(runs), "median_s": statistics.median(runs), "runs_s": runs}, result
+
+
+def bench_size(name: str, params, repeat: int, workdir: str) -> dict:
+    components, pads, footprints, files, outlines_per_file = params
+    lib_dir = os.path.join(workdir, f"lib_{name}")
+    netlist_path = os.path.join(workdir, f"{name}.net")
+    generate_library(lib_dir, files, outlines_per_file)
+    generate_netlist(netlist_path, components, pads, footprints)
+    lines = vnm.read_text(netlist_path).splitlines(keepends=True)
+
+    timings = {}
+    timings["scan_veecad_outlines"], (outlines, _by_file) = _time(lambda: vnm.scan_veecad_outlines(lib_dir), repeat)
+    timings["parse_netlist_headers"], headers = _time(lambda: vnm.parse_netlist_headers(lines), repeat)
+    timings["compute_component_pin_counts"], _ = _time(lambda: vnm.compute_component_pin_counts(headers, lines), repeat)
+    fps = sorted(vnm.group_by_current_footprint(headers))
+
+    def auto_map_all():
+        # A fresh engine per repetition, so its per-footprint memo cannot turn repeats into cache hits
+        engine = vnm.AutoMapRuleEngine(vnm.DEFAULT_AUTO_MAP_RULES)
+        return {fp: vnm.auto_map_outline(fp, outlines, engine=engine) for fp in fps}
+
+    timings["auto_map_outline"], auto = _time(auto_map_all, repeat)
+    mapping = {fp: outline for fp, outline in auto.items() if outline}
+    timings["apply_mapping"], _ = _time(lambda: vnm.apply_mapping(lines, headers, mapping), repeat)
+    return {
+        "size": name,
+        "components": components,
+        "pads_per_component": pads,
+        "footprints": footprints,
+        "library_files": files,
+        "outlines_per_file": outlines_per_file,
+        "outlines_found": len(outlines),
+        "timings": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark veecad_netlist_map stages on synthetic inputs")
+    parser.add_argument("--sizes", default="small,medium", help=f"Comma-separated sizes from: {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions per stage (default: 3)")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--keep", help="Generate inputs into this directory and keep them")
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="veecad_bench_") as tmp:
+        workdir = args.keep or tmp
+        os.makedirs(workdir, exist_ok=True)
+        for name in sizes:
+            print(f"Benchmarking '{name}'...")
+            run = bench_size(name, SIZES[name], args.repeat, workdir)
+            for stage, t in run["timings"].items():
+                print(f"  {stage:30s} min {t['min_s'] * 1000:9.2f} ms  median {t['median_s'] * 1000:9.2f} ms")
+            results["runs"].append(run)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote results: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import veecad_netlist_map as vnm
+
+
+NETLIST_HEAD = "( { EESchema Netlist Version 1.1 created  2025-01-01T00:00:00+0000 }\n"
+
+
+class NetlistParserTest(unittest.TestCase):
+    def test_sub_sheet_components_are_parsed(self):
+        lines = [
+            NETLIST_HEAD,
+            " ( /0a6f7158-c16c-433d-ae1e-ccc3ceb8f04d Resistor_THT:R_Axial  R1 100k\n",
+            "  (    1 Net-(R1-Pad1) )\n",
+            " )\n",
+            " ( /5e2a0b3c-1111-4222-8333-944455556666/27e8107f-c0e3-4018-87eb-9144d9cddead Capacitor_THT:C_Disc  C1 100n\n",
+            "  (    1 Net-(R1-Pad1) )\n",
+            "  (    2 GND )\n",
+            " )\n",
+            ")\n",
+            "*\n",
+        ]
+        headers = vnm.parse_netlist_headers(lines)
+        self.assertEqual([h["ref"] for h in headers], ["R1", "C1"])
+        self.assertEqual(headers[1]["uuid"], "5e2a0b3c-1111-4222-8333-944455556666/27e8107f-c0e3-4018-87eb-9144d9cddead")
+        self.assertEqual(headers[1]["footprint"], "Capacitor_THT:C_Disc")
+        self.assertEqual(headers[1]["pin_count"], 2)
+
+    def test_truncated_netlist_is_rejected(self):
+        lines = [
+            NETLIST_HEAD,
+            " ( /0a6f7158-c16c-433d-ae1e-ccc3ceb8f04d Resistor_THT:R_Axial  R1 100k\n",
+            " )\n",
+        ]
+        with self.assertRaises(vnm.NetlistParseError):
+            vnm.parse_netlist_headers(lines)
+        with self.assertRaises(vnm.NetlistParseError):
+            vnm.parse_netlist_headers(lines + [" ( /27e8107f-c0e3 Capacitor_THT:C"])
+
+
+class AutoMapRuleEngineTest(unittest.TestCase):
+    def test_rules_that_cannot_be_spliced_keep_their_meaning(self):
+        engine = vnm.AutoMapRuleEngine([
+            {"pattern": r"(a)\1", "outlines": ["AA"]},
+            {"pattern": r"(x)(y)\2", "outlines": ["{1}{2}"]},
+            {"pattern": r"(?i)SOD(\d+)", "outlines": ["SOD{1}"]},
+            {"pattern": r"dip-(\d+)", "outlines": ["DIP{1:int}"]},
+        ])
+        outlines = {"AA": None, "xy": None, "SOD123": None, "DIP8": None}
+        self.assertEqual(engine.resolve("Lib:aa", outlines), "AA")
+        self.assertEqual(engine.resolve("Lib:xyy", outlines), "xy")
+        self.assertIsNone(engine.resolve("Lib:xyx", outlines))
+        self.assertEqual(engine.resolve("Diode_SMD:SOD123", outlines), "SOD123")
+        self.assertEqual(engine.resolve("Package_DIP:DIP-08_W7.62mm", outlines), "DIP8")
+
+
+def _write_json_per(path, outlines):
+    data = {
+        "Info": {"Comment": "Bibliothèque"},
+        "CelledOutlines": [
+            {"Name": name, "Rows": [[{"Pin": f"{i + 1}µ", "Shape": 1}] for i in range(pins)], "PinNames": [f"{i + 1}µ" for i in range(pins)]}
+            for name, pins in outlines
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("VeeCAD Library\n" + json.dumps(data, ensure_ascii=False, indent=1) + "\n")
+
+
+class LazyPinsTest(unittest.TestCase):
+    def scan(self, files, per_file, **kwargs):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for f in range(files):
+            # Names interleave across files, so name order alternates between them
+            _write_json_per(os.path.join(tmp.name, f"lib{f}.per"), [(f"OL{k:04d}_{f}", k % 7 + 1) for k in range(per_file)])
+        return vnm.scan_veecad_outlines(tmp.name, **kwargs)
+
+    def test_lazy_pins_match_full_scan(self):
+        full, _ = self.scan(3, 20)
+        lazy, _ = self.scan(3, 20, lazy_pins=True)
+        self.assertEqual(sorted(full), sorted(lazy))
+        for name, info in full.items():
+            self.assertEqual(lazy[name].pin_names, info.pin_names)
+            self.assertEqual(lazy[name].pin_count, info.pin_count)
+            self.assertEqual(lazy[name].pin_positions, info.pin_positions)
+
+    def decoded_bytes_per_outline(self, per_file):
+        outlines, _ = self.scan(4, per_file, lazy_pins=True)
+        decoded = []
+        real_loads = json.loads
+
+        def counting_loads(s, *args, **kwargs):
+            decoded.append(len(s))
+            return real_loads(s, *args, **kwargs)
+
+        with mock.patch.object(vnm.json, "loads", counting_loads):
+            for name in sorted(outlines):
+                outlines[name].pin_count
+        return sum(decoded) / len(outlines)
+
+    def test_resolving_does_not_reparse_whole_files(self):
+        # Work per outline must not grow with the number of outlines sharing a file
+        small = self.decoded_bytes_per_outline(10)
+        large = self.decoded_bytes_per_outline(300)
+        self.assertLess(large, small * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,26 +1,68 @@
 #!/usr/bin/env python3
 import argparse
+import bisect
+import functools
+import glob
+import hashlib
+import heapq
+import itertools
 import json
+import math
+import mmap
 import os
 import re
+import shutil
 import sys
 import textwrap
+import time
+from array import array
 from collections import defaultdict
-from datetime import datetime
+from contextlib import contextmanager
 
 
 DEFAULT_LIB_DIR = \
     "/home/aykut/.wine/drive_c/Program Files (x86)/VeeCAD/Library"
 
 
+# Sub-sheet components carry a uuid path: ( /<sheet-uuid>/<symbol-uuid> fp ref value
 COMPONENT_HEADER_RE = re.compile(
-    r"^\s*\(\s*/(?P<uuid>[0-9A-Fa-f\-]+)\s+"
+    r"^\s*\(\s*/(?P<uuid>[0-9A-Fa-f\-/]+)\s+"
     r"(?P<footprint>\S+)\s+"
     r"(?P<ref>\S+)\s+"
     r"(?P<value>.*)$",
     re.IGNORECASE,
 )
 
+# Any line opening a component block, well-formed or not
+COMPONENT_START_RE = re.compile(r"^\s*\(\s*/")
+
+# "( { EESchema Netlist Version 1.1 ... }": opens the list enclosing all components
+NETLIST_START_RE = re.compile(r"^\s*\(\s*\{")
+
+OUTLINE_HEADER_RE = re.compile(rb"^([A-Za-z0-9_]+)\s*,\s*\d+\s*$")
+
+# Lines of an INI-style .per file that drive outline parsing. Everything else
+# is skipped by the regex engine without being decoded or copied.
+PER_LINE_RE = re.compile(
+    rb"^[ \t\f\v]*(?:"
+    rb"\[(?P<section>[^\r\n]*)\]"
+    rb"|(?P<end>[Ee][Nn][Dd])"
+    rb"|[Pp][Ii][Nn],(?P<pin>[^,\r\n]*)(?:,(?P<px>[^,\r\n]*),(?P<py>[^,\r\n]*))?[^\r\n]*?"
+    rb"|(?P<name>[A-Za-z0-9_]+)[ \t\f\v]*,[ \t\f\v]*[0-9]+"
+    rb")[ \t\r\f\v]*$",
+    re.MULTILINE,
+)
+
+CAPR_SIZE_RE = re.compile(r"^CAPR([0-9]+(?:\.[0-9]+)?)_([0-9]+(?:\.[0-9]+)?)$")
+
+PAD_LINE_RE = re.compile(r"^\s*\(\s*(?P<pad>[0-9A-Za-z]+)\b\s*(?P<net>.*?)\s*\)?\s*$")
+
+# Bump when the record layout stored in the outline index changes
+OUTLINE_INDEX_VERSION = 5
+
+# Bump when the --check snapshot layout changes
+CHECK_SNAPSHOT_VERSION = 1
+
 
 def read_text(path: str) -> str:
     with open(path, "r", encoding="utf-8") as f:
@@ -33,19 +75,107 @@ def write_text(path: str, content: str) -> None:
 
 
 def backup_file(path: str) -> str:
+    from datetime import datetime
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_path = f"{path}.{timestamp}.bak"
-    with open(path, "rb") as src, open(backup_path, "wb") as dst:
-        dst.write(src.read())
+    try:
+        # Rewrites replace the file by rename, so a hard link keeps the original intact
+        os.link(path, backup_path)
+    except OSError:
+        shutil.copyfile(path, backup_path)
     return backup_path
 
 
-def _extract_json_block(text: str) -> str | None:
-    start = text.find("{")
-    end = text.rfind("}")
+@contextmanager
+def _mapped_file(path: str):
+    """Read-only memory map of a file (b"" for an empty file, which cannot be mapped)."""
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            buf = None
+        if buf is None:
+            yield b""
+            return
+        with buf:
+            yield buf
+
+
+def _extract_json_block(buf) -> bytes | None:
+    start = buf.find(b"{")
+    end = buf.rfind(b"}")
     if start == -1 or end == -1 or end <= start:
         return None
-    return text[start:end + 1]
+    return buf[start:end + 1]
+
+
+JSON_WS_RE = re.compile(r"[ \t\n\r]*")
+
+JSON_OUTLINE_CONTAINERS = ("CelledOutlines", "Outlines")
+
+
+def _json_outline_spans(block: bytes) -> dict | None:
+    """
+    Walk the top-level object of a JSON .per block without building it:
+    {container key: [(outline object, start, end), ...]} for the outline arrays,
+    start/end being byte offsets of each object within `block`. Like json.loads,
+    a repeated key keeps its last value. None if the block is not a JSON object.
+    """
+    try:
+        text = block.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    decoder = json.JSONDecoder()
+    ws = JSON_WS_RE.match
+    if text.isascii():
+        def to_byte(i):
+            return i
+    else:
+        # Offsets are requested in increasing order, so encode only the stretch since the last one
+        last = [0, 0]
+
+        def to_byte(i):
+            last[1] += len(text[last[0]:i].encode("utf-8"))
+            last[0] = i
+            return last[1]
+    spans = {}
+    try:
+        pos = ws(text, 0).end()
+        if text[pos] != "{":
+            return None
+        pos = ws(text, pos + 1).end()
+        while text[pos] != "}":
+            key, pos = decoder.raw_decode(text, pos)
+            pos = ws(text, pos).end()
+            if text[pos] != ":":
+                return None
+            pos = ws(text, pos + 1).end()
+            if key in JSON_OUTLINE_CONTAINERS and text[pos] == "[":
+                items = spans[key] = []
+                pos = ws(text, pos + 1).end()
+                while text[pos] != "]":
+                    obj, end = decoder.raw_decode(text, pos)
+                    items.append((obj, to_byte(pos), to_byte(end)))
+                    pos = ws(text, end).end()
+                    if text[pos] == ",":
+                        pos = ws(text, pos + 1).end()
+                    elif text[pos] != "]":
+                        return None
+                pos += 1
+            else:
+                spans.pop(key, None)
+                _value, pos = decoder.raw_decode(text, pos)
+            pos = ws(text, pos).end()
+            if text[pos] == ",":
+                pos = ws(text, pos + 1).end()
+            elif text[pos] != "}":
+                return None
+        if ws(text, pos + 1).end() != len(text):
+            return None
+    except (ValueError, IndexError):
+        return None
+    return spans
 
 
 def _collect_pin_names_from_obj(obj, pin_names: set[str]):
@@ -65,8 +195,10 @@ def _infer_sizes_from_name(outline_name: str) -> dict:
     """
     info: dict[str, object] = {}
     name = outline_name.upper()
+    if not name.startswith(("CAPR", "BOX")):
+        return info
     # CAPR<diameter>_<pitch> e.g., CAPR10_5, CAPR15_7.5
-    m = re.match(r"^CAPR([0-9]+(?:\.[0-9]+)?)_([0-9]+(?:\.[0-9]+)?)$", name)
+    m = CAPR_SIZE_RE.match(name)
     if m:
         try:
             diameter = float(m.group(1))
@@ -85,192 +217,914 @@ def _infer_sizes_from_name(outline_name: str) -> dict:
     return info
 
 
-def scan_veecad_outlines(lib_dir: str):
-    """
-    Scan .per files for outline names. Returns:
-      - outlines: dict[name] -> set of source .per relative paths
-      - outlines_by_file: dict[per_rel] -> set of names
-    """
-    outlines: dict[str, dict] = {}
-    outlines_by_file: dict[str, set[str]] = defaultdict(set)
-    if not os.path.isdir(lib_dir):
-        raise FileNotFoundError(f"VeeCAD library directory not found: {lib_dir}")
-
-    for root, _dirs, files in os.walk(lib_dir):
-        for fn in files:
-            if not fn.lower().endswith(".per"):
-                continue
-            per_path = os.path.join(root, fn)
-            text = None
-            try:
-                text = read_text(per_path)
-            except Exception:
-                continue
+def _count(stats: dict | None, key: str, n: int = 1) -> None:
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + n
 
-            rel = os.path.relpath(per_path, lib_dir)
 
-            # Prefer parsing JSON block for accurate pin info
-            block = _extract_json_block(text)
-            parsed = None
-            if block:
-                try:
-                    parsed = json.loads(block)
-                except Exception:
-                    parsed = None
-            if parsed and isinstance(parsed, dict):
-                # Two possible containers: CelledOutlines and/or Outlines
-                for container_key in ("CelledOutlines", "Outlines"):
-                    arr = parsed.get(container_key)
-                    if not isinstance(arr, list):
-                        continue
-                    for outline_obj in arr:
-                        if not isinstance(outline_obj, dict):
-                            continue
-                        name = outline_obj.get("Name")
-                        if not isinstance(name, str) or not name.strip():
-                            continue
-                        name = name.strip()
-                        pin_names: set[str] = set()
-                        # Common field is "Rows" in CelledOutlines. But just recursively scan.
-                        _collect_pin_names_from_obj(outline_obj, pin_names)
-                        if name not in outlines:
-                            outlines[name] = {
-                                "files": set(),
-                                "pin_names": set(),
-                                "pin_count": 0,
-                            }
-                        outlines[name]["files"].add(rel)
-                        outlines[name]["pin_names"].update(pin_names)
-                        outlines[name]["pin_count"] = max(outlines[name]["pin_count"], len(outline_obj.get("PinNames", pin_names)))
-                        # Attach inferred sizes
-                        sizes = _infer_sizes_from_name(name)
-                        if sizes:
-                            outlines[name].setdefault("sizes", {}).update(sizes)
-                        outlines_by_file[rel].add(name)
-                continue
+OUTLINE_SECTIONS = {b"outlines", b"leadedoutlines", b"radialoutlines", b"customoutlines"}
 
-            # Fallback text-based VeeCAD .per parser
-            # Recognize outline blocks under [Outlines]/[LeadedOutlines]/[RadialOutlines]/[CustomOutlines]
-            lines = text.splitlines()
-            in_outline_section = False
-            current_name = None
-            current_pins = set()
-            def commit_current():
-                nonlocal current_name, current_pins
-                if not current_name:
-                    return
-                name = current_name
-                if name not in outlines:
-                    outlines[name] = {
-                        "files": set(),
-                        "pin_names": set(),
-                        "pin_count": 0,
-                        "sizes": {},
-                    }
-                outlines[name]["files"].add(rel)
-                outlines[name]["pin_names"].update(current_pins)
-                outlines[name]["pin_count"] = max(outlines[name]["pin_count"], len(current_pins))
-                sizes = _infer_sizes_from_name(name)
-                if sizes:
-                    outlines[name]["sizes"].update(sizes)
-                outlines_by_file[rel].add(name)
-                current_name = None
-                current_pins = set()
 
-            for raw in lines:
-                line = raw.strip()
-                if not line:
-                    continue
-                if line.startswith("[") and line.endswith("]"):
-                    # Section switch
-                    section = line[1:-1].strip().lower()
-                    if section in {"outlines", "leadedoutlines", "radialoutlines", "customoutlines"}:
-                        in_outline_section = True
-                        # Commit any dangling outline on section switch
-                        commit_current()
+def _parse_per_buffer(buf, stats: dict | None = None, lazy: bool = False) -> list:
+    """
+    Parse one .per file (bytes or a memory map) into outline records.
+    Each record is [name, sorted pin names, pin count, from_json, positions],
+    positions being a flat [pin, x, y, ...] list in 0.1" grid units or None;
+    records are plain lists so they can be stored in the on-disk outline index as-is.
+    With lazy=True only names are indexed: records are [name, None, locator,
+    from_json, None], where the locator lets _LazyPinLoader parse the pins later:
+    ["json", start, end] byte offsets of the outline's JSON object in the file,
+    or ["text", offset] of its header line.
+    """
+    records = []
+
+    # Prefer parsing JSON block for accurate pin info
+    block = _extract_json_block(buf)
+    parsed = None
+    if block and lazy:
+        spans = _json_outline_spans(block)
+        if spans is None:
+            _count(stats, "json_decode_failures")
+        else:
+            _count(stats, "files_parsed_json")
+            block_start = buf.find(b"{")
+            for container_key in JSON_OUTLINE_CONTAINERS:
+                for outline_obj, start, end in spans.get(container_key, ()):
+                    if not isinstance(outline_obj, dict):
                         continue
-                    else:
-                        # Other sections like Components: stop outline parsing
-                        if in_outline_section:
-                            commit_current()
-                        in_outline_section = False
+                    name = outline_obj.get("Name")
+                    if not isinstance(name, str) or not name.strip():
                         continue
-                if not in_outline_section:
+                    records.append([name.strip(), None, ["json", block_start + start, block_start + end], True, None])
+            return records
+    elif block:
+        try:
+            parsed = json.loads(block)
+        except Exception:
+            parsed = None
+            _count(stats, "json_decode_failures")
+    if parsed and isinstance(parsed, dict):
+        _count(stats, "files_parsed_json")
+        # Two possible containers: CelledOutlines and/or Outlines
+        for container_key in JSON_OUTLINE_CONTAINERS:
+            arr = parsed.get(container_key)
+            if not isinstance(arr, list):
+                continue
+            for outline_obj in arr:
+                if not isinstance(outline_obj, dict):
                     continue
-                # Start of outline definition: Name,number
-                if current_name is None:
-                    m = re.match(r"^([A-Za-z0-9_]+)\s*,\s*\d+\s*$", line)
-                    if m:
-                        current_name = m.group(1)
-                        current_pins = set()
+                name = outline_obj.get("Name")
+                if not isinstance(name, str) or not name.strip():
                     continue
-                # Inside an outline block
-                if line.lower() == "end":
+                name = name.strip()
+                pin_names, pin_count, positions = _json_outline_pins(outline_obj)
+                records.append([name, sorted(pin_names), pin_count, True, positions])
+        return records
+
+    # Fallback text-based VeeCAD .per parser
+    _count(stats, "files_parsed_text")
+    # Recognize outline blocks under [Outlines]/[LeadedOutlines]/[RadialOutlines]/[CustomOutlines]
+    in_outline_section = False
+    current_name = None
+    current_offset = 0
+    current_pins = set()
+    current_positions = {}
+    def commit_current():
+        nonlocal current_name, current_pins, current_positions
+        if not current_name:
+            return
+        if lazy:
+            records.append([current_name, None, ["text", current_offset], False, None])
+        else:
+            records.append([current_name, sorted(current_pins), len(current_pins), False, _flatten_positions(current_positions)])
+        current_name = None
+        current_pins = set()
+        current_positions = {}
+
+    for m in PER_LINE_RE.finditer(buf):
+        section = m.group("section")
+        if section is not None:
+            # Section switch
+            if section.strip().lower() in OUTLINE_SECTIONS:
+                in_outline_section = True
+                # Commit any dangling outline on section switch
+                commit_current()
+            else:
+                # Other sections like Components: stop outline parsing
+                if in_outline_section:
                     commit_current()
+                in_outline_section = False
+            continue
+        if not in_outline_section:
+            continue
+        # Start of outline definition: Name,number
+        if current_name is None:
+            name = _outline_header_name(m)
+            if name:
+                current_name = name
+                current_offset = m.start()
+                current_pins = set()
+            continue
+        # Inside an outline block
+        if m.group("end") is not None:
+            commit_current()
+            continue
+        if not lazy:
+            _add_pin_from_match(m, current_pins, current_positions)
+    return records
+
+
+def _outline_header_name(m) -> str | None:
+    name = m.group("name")
+    if name is None and m.group("pin") is not None:
+        # "Pin,2" is a pin line inside an outline but a header outside one
+        header = OUTLINE_HEADER_RE.match(m.group(0).strip())
+        name = header.group(1) if header else None
+    return name.decode("ascii") if name else None
+
+
+def _json_outline_pins(outline_obj: dict):
+    pin_names: set[str] = set()
+    # Common field is "Rows" in CelledOutlines. But just recursively scan.
+    _collect_pin_names_from_obj(outline_obj, pin_names)
+    positions = {}
+    _collect_pin_positions_from_obj(outline_obj, positions)
+    return pin_names, len(outline_obj.get("PinNames", pin_names)), _flatten_positions(positions)
+
+
+def _coordinate(value):
+    """int or float from a .per coordinate (str, bytes or number), None if it is not one."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def _collect_pin_positions_from_obj(obj, positions: dict) -> None:
+    """Pin positions of a JSON outline: cell column/row in a "Rows" grid, or explicit X/Y keys."""
+    if isinstance(obj, dict):
+        rows = obj.get("Rows")
+        if isinstance(rows, list):
+            for y, row in enumerate(rows):
+                if not isinstance(row, list):
                     continue
-                if line.lower().startswith("pin,"):
-                    # Pin,<id>,x,y
-                    parts = [p.strip() for p in line.split(",")]
-                    if len(parts) >= 2:
-                        pin_id = parts[1]
-                        if pin_id:
-                            current_pins.add(pin_id)
-
-    # Finalize pin_count from pin_names
+                for x, cell in enumerate(row):
+                    if isinstance(cell, dict) and isinstance(cell.get("Pin"), str):
+                        positions.setdefault(cell["Pin"].strip(), (x, y))
+        if isinstance(obj.get("Pin"), str):
+            x = _coordinate(obj.get("X", obj.get("x")))
+            y = _coordinate(obj.get("Y", obj.get("y")))
+            if x is not None and y is not None:
+                positions.setdefault(obj["Pin"].strip(), (x, y))
+        for v in obj.values():
+            _collect_pin_positions_from_obj(v, positions)
+    elif isinstance(obj, list):
+        for v in obj:
+            _collect_pin_positions_from_obj(v, positions)
+
+
+def _flatten_positions(positions: dict) -> list | None:
+    """{pin: (x, y)} as a flat [pin, x, y, ...] list sorted by pin, None when empty."""
+    if not positions:
+        return None
+    flat = []
+    for pin in sorted(positions):
+        x, y = positions[pin]
+        flat.extend((pin, x, y))
+    return flat
+
+
+def _add_pin_from_match(m, pins: set, positions: dict | None = None) -> None:
+    # Pin,<id>,x,y
+    pin_id = m.group("pin")
+    if pin_id is not None:
+        pin_id = pin_id.strip()
+        if pin_id:
+            pin_id = pin_id.decode("utf-8", "replace")
+            pins.add(pin_id)
+            if positions is not None and m.group("px") is not None:
+                x = _coordinate(m.group("px"))
+                y = _coordinate(m.group("py"))
+                if x is not None and y is not None:
+                    positions.setdefault(pin_id, (x, y))
+
+
+def _parse_ini_outline_at(buf, offset: int):
+    """Pins of the text-format outline whose 'Name,N' header line starts at buf[offset]."""
+    pins = set()
+    positions = {}
+    lines = PER_LINE_RE.finditer(buf, offset)
+    # Skip the outline's own header line
+    next(lines, None)
+    for m in lines:
+        # The block ends at End or at any section switch
+        if m.group("end") is not None or m.group("section") is not None:
+            break
+        _add_pin_from_match(m, pins, positions)
+    return pins, len(pins), _flatten_positions(positions)
+
+
+class _LazyPinLoader:
+    """
+    Parses pin details of lazily indexed outlines on first use. Locators point
+    at the outline itself, so only its own JSON object or text block is read,
+    however many outlines share the file.
+    """
+
+    def __init__(self, lib_dir: str, file_table: list):
+        self.lib_dir = lib_dir
+        self.file_table = file_table
+
+    def details(self, file_id: int, locator: list):
+        path = os.path.join(self.lib_dir, self.file_table[file_id])
+        try:
+            with _mapped_file(path) as buf:
+                if locator[0] == "json":
+                    return _json_outline_pins(json.loads(buf[locator[1]:locator[2]]))
+                return _parse_ini_outline_at(buf, locator[1])
+        except Exception:
+            # The file changed or vanished since the scan; report no pins
+            return set(), 0, None
+
+
+class OutlineInfo:
+    """
+    One outline in the scanned catalog. Names and pin names are interned, pin
+    names are a frozenset and source files are integer IDs into the file table
+    shared by every outline of one scan. Pin positions are kept as one flat
+    (pin, x, y, ...) tuple. After a lazy scan, pin_names, pin_count and
+    pin_positions are parsed from the source files on first access.
+    """
+
+    __slots__ = ("name", "file_ids", "_pin_names", "_pin_count", "_pin_xy", "sizes", "file_table", "_label", "_pending", "_loader")
+
+    def __init__(self, name: str, file_table: list):
+        self.name = sys.intern(name)
+        self.file_ids = []
+        self._pin_names = set()
+        self._pin_count = 0
+        self._pin_xy = None
+        self.sizes = _infer_sizes_from_name(name) or None
+        self.file_table = file_table
+        self._label = None
+        self._pending = None
+        self._loader = None
+
+    def _finalize(self) -> None:
+        self.file_ids = tuple(self.file_ids)
+        if not self._pending:
+            self._freeze()
+
+    def _freeze(self) -> None:
+        self._pin_names = frozenset(sys.intern(p) for p in self._pin_names)
+        if self._pin_count == 0 and self._pin_names:
+            self._pin_count = len(self._pin_names)
+
+    def _resolve(self) -> None:
+        pending, self._pending = self._pending, None
+        for file_id, locator in pending:
+            pin_names, pin_count, positions = self._loader.details(file_id, locator)
+            self._pin_names.update(pin_names)
+            self._pin_count = max(self._pin_count, pin_count)
+            self._add_positions(positions)
+        self._loader = None
+        self._freeze()
+
+    def _add_positions(self, positions) -> None:
+        # The first file that places the pins wins, like the first file listed in `files`
+        if positions and self._pin_xy is None:
+            self._pin_xy = tuple(sys.intern(v) if isinstance(v, str) else v for v in positions)
+
+    @property
+    def pins_loaded(self) -> bool:
+        return not self._pending
+
+    @property
+    def pin_names(self) -> frozenset:
+        if self._pending:
+            self._resolve()
+        return self._pin_names
+
+    @property
+    def pin_count(self) -> int:
+        if self._pending:
+            self._resolve()
+        return self._pin_count
+
+    @property
+    def pin_xy(self) -> tuple:
+        """Pin positions as a flat (pin, x, y, ...) tuple sorted by pin name."""
+        if self._pending:
+            self._resolve()
+        return self._pin_xy or ()
+
+    @property
+    def pin_positions(self) -> dict:
+        """{pin: (x, y)} in 0.1" grid units; empty when the library gives no coordinates."""
+        xy = self.pin_xy
+        return {xy[i]: (xy[i + 1], xy[i + 2]) for i in range(0, len(xy), 3)}
+
+    @property
+    def files(self) -> set[str]:
+        return {self.file_table[i] for i in self.file_ids}
+
+    @property
+    def label(self) -> str:
+        """Display label with pin count and inferred sizes, built once."""
+        if self._label is None:
+            size = ""
+            sizes = self.sizes or {}
+            if sizes.get("size_label"):
+                size = sizes["size_label"]
+            elif sizes.get("pitch_mm") or sizes.get("diameter_mm"):
+                pitch = sizes.get("pitch_mm")
+                dia = sizes.get("diameter_mm")
+                parts = []
+                if dia:
+                    parts.append(f"D={dia:g}mm")
+                if pitch:
+                    parts.append(f"P={pitch:g}mm")
+                if parts:
+                    size = ", ".join(parts)
+            suffix = []
+            if self.pin_count:
+                suffix.append(f"{self.pin_count} pins")
+            if size:
+                suffix.append(size)
+            self._label = f"{self.name} ({'; '.join(suffix)})" if suffix else f"{self.name}"
+        return self._label
+
+    def __getstate__(self):
+        # Compact pickling: a plain tuple instead of a slot-name dict per outline
+        pin_names = self.pin_names
+        return (self.name, self.file_ids, pin_names, self._pin_count, self._pin_xy, self.sizes, self.file_table)
+
+    def __setstate__(self, state):
+        self.name, self.file_ids, self._pin_names, self._pin_count, self._pin_xy, self.sizes, self.file_table = state
+        self._label = None
+        self._pending = None
+        self._loader = None
+
+    def as_dict(self) -> dict:
+        return {
+            "files": self.files,
+            "pin_names": set(self.pin_names),
+            "pin_count": self.pin_count,
+            "pin_positions": self.pin_positions,
+            "sizes": dict(self.sizes or {}),
+        }
+
+    def __repr__(self):
+        return f"OutlineInfo({self.name!r}, pin_count={self.pin_count}, files={sorted(self.files)!r})"
+
+
+def _merge_outline_records(outlines: dict, outlines_by_file: dict, file_table: list, rel: str, records: list, loader: _LazyPinLoader | None = None, wanted: set | None = None, duplicate: bool = False, shadowed: set | None = None) -> None:
+    """
+    Add one file's records to the catalog. A `duplicate` file (same content as
+    one merged before) and outlines in `shadowed` only gain the file; their pins
+    come from the earlier file or library root.
+    """
+    if not records:
+        return
+    rel = sys.intern(rel)
+    file_id = len(file_table)
+    file_table.append(rel)
+    names = outlines_by_file.setdefault(rel, [])
+    for name, pin_names, pin_count, _from_json, positions in records:
+        if wanted is not None and name not in wanted:
+            continue
+        info = outlines.get(name)
+        if info is None:
+            info = outlines[name] = OutlineInfo(name, file_table)
+        # A file's records are merged together, so checking the last ID dedups
+        if not info.file_ids or info.file_ids[-1] != file_id:
+            info.file_ids.append(file_id)
+        if duplicate or (shadowed and name in shadowed):
+            pass
+        elif pin_names is None:
+            # Lazy record: pin_count holds the locator for _LazyPinLoader
+            if info._pending is None:
+                info._pending = []
+            info._pending.append((file_id, pin_count))
+            info._loader = loader
+        else:
+            info._pin_names.update(pin_names)
+            info._pin_count = max(info._pin_count, pin_count)
+            info._add_positions(positions)
+        names.append(info.name)
+
+
+def _finalize_outlines(outlines: dict, outlines_by_file: dict) -> None:
     for info in outlines.values():
-        if info["pin_count"] == 0 and info["pin_names"]:
-            info["pin_count"] = len(info["pin_names"])
+        info._finalize()
+    for rel, names in outlines_by_file.items():
+        outlines_by_file[rel] = tuple(sorted(set(names)))
+
+
+def _outline_index_path(cache_dir: str, lib_dir: str) -> str:
+    key = hashlib.sha1(os.path.abspath(lib_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"veecad_outline_index_{key}.json")
+
+
+def load_outline_index(cache_dir: str, lib_dir: str) -> dict:
+    """
+    Load the persistent per-file outline index for lib_dir.
+    Returns dict[per_rel] -> {"size", "mtime_ns", "outlines"}; empty if missing or stale.
+    """
+    path = _outline_index_path(cache_dir, lib_dir)
+    try:
+        data = json.loads(read_text(path))
+    except Exception:
+        return {}
+    if not isinstance(data, dict) or data.get("version") != OUTLINE_INDEX_VERSION:
+        return {}
+    if data.get("lib_dir") != os.path.abspath(lib_dir):
+        return {}
+    files = data.get("files")
+    return files if isinstance(files, dict) else {}
+
+
+def save_outline_index(cache_dir: str, lib_dir: str, files: dict) -> str:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _outline_index_path(cache_dir, lib_dir)
+    data = {
+        "version": OUTLINE_INDEX_VERSION,
+        "lib_dir": os.path.abspath(lib_dir),
+        "files": files,
+    }
+    # Write next to the target and rename so a crash never leaves a truncated index
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write_text(tmp_path, json.dumps(data, separators=(",", ":")))
+    os.replace(tmp_path, path)
+    return path
+
+
+def _check_snapshot_path(cache_dir: str, lib_dir) -> str:
+    roots = "\n".join(os.path.abspath(root) for root in library_roots(lib_dir))
+    key = hashlib.sha1(roots.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"veecad_check_snapshot_{key}.json")
+
+
+def signature_digest(signature: dict) -> str:
+    """One hash over a library_signature(), for storing next to data derived from that library state."""
+    h = hashlib.sha1()
+    for key in sorted(signature):
+        size, mtime_ns = signature[key]
+        h.update(f"{key}\0{size}\0{mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_check_snapshot(cache_dir: str, lib_dir, signature: str) -> dict | None:
+    """
+    The name-level catalog snapshot --check keeps for lib_dir, if it was taken
+    at `signature` (see signature_digest): {"library_files", "names" (every
+    outline name, newline-joined), "pins": name -> [pin_count, pin names] and
+    "missing": set of names found absent}. Pins and absences are only stored for
+    names some earlier check asked about. None if missing or stale.
+    """
+    try:
+        data = json.loads(read_text(_check_snapshot_path(cache_dir, lib_dir)))
+    except Exception:
+        return None
+    if not isinstance(data, dict) or data.get("version") != CHECK_SNAPSHOT_VERSION or data.get("signature") != signature:
+        return None
+    data["missing"] = set(data["missing"])
+    return data
+
+
+def save_check_snapshot(cache_dir: str, lib_dir, signature: str, snapshot: dict) -> str:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _check_snapshot_path(cache_dir, lib_dir)
+    data = {
+        "version": CHECK_SNAPSHOT_VERSION,
+        "signature": signature,
+        "library_files": snapshot["library_files"],
+        # One string decodes far faster than a list of tens of thousands of names
+        "names": snapshot["names"],
+        "pins": snapshot["pins"],
+        "missing": sorted(snapshot["missing"]),
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write_text(tmp_path, json.dumps(data, separators=(",", ":")))
+    os.replace(tmp_path, path)
+    return path
+
+
+def _parse_per_file(per_path: str, lazy: bool = False):
+    """
+    Read, hash and parse one .per file. Runs in pool workers, so it returns
+    (records or None if unreadable, content sha1, parse counters) instead of
+    mutating shared state.
+    """
+    stats = {}
+    try:
+        with _mapped_file(per_path) as buf:
+            return _parse_per_buffer(buf, stats, lazy), hashlib.sha1(buf).hexdigest(), stats
+    except OSError:
+        stats["read_failures"] = 1
+        return None, None, stats
+
+
+def _read_file_bytes(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _read_ahead(items, io_threads: int, depth: int | None = None):
+    """
+    Yield (item, file bytes or None) in the order of `items`, a walk that runs in
+    its own thread. Items without cached records (item[5] is None) are read by
+    `io_threads` reader threads; at most `depth` (default 4 per thread) walked
+    items wait for the consumer, which bounds the bytes held in memory.
+    """
+    import queue
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    depth = depth or io_threads * 4
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    pool = ThreadPoolExecutor(max_workers=io_threads)
+
+    def walker():
+        try:
+            for item in items:
+                future = pool.submit(_read_file_bytes, item[3]) if item[5] is None else None
+                if not put((item, future)):
+                    return
+        except BaseException as e:
+            put((end, e))
+            return
+        put((end, None))
+
+    thread = threading.Thread(target=walker, name="veecad-walk", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, future = ready.get()
+            if item is end:
+                if future is not None:
+                    raise future
+                break
+            yield item, (future.result() if future is not None else None)
+    finally:
+        # Consumer finished or gave up: release a walker blocked on a full queue
+        stop.set()
+        thread.join()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def library_roots(lib_dir) -> list[str]:
+    """One library directory, or a list of them in precedence order (first wins)."""
+    return [lib_dir] if isinstance(lib_dir, str) else list(lib_dir)
+
+
+def _walk_per_files(roots: list[str]):
+    """
+    Yield (root index, path relative to its root, catalog key, path) for every
+    .per file, roots in order. Keys are relative paths for the first root and
+    absolute paths for the others, so they stay unique and joining the first
+    root with any key gives the file.
+    """
+    for root_idx, lib_dir in enumerate(roots):
+        abs_lib_dir = os.path.abspath(lib_dir)
+        for root, _dirs, files in os.walk(lib_dir):
+            # os.walk() extends lib_dir by joining, so the relative part is a plain suffix
+            sub = root[len(lib_dir):].lstrip(os.sep)
+            for fn in files:
+                if not fn.lower().endswith(".per"):
+                    continue
+                rel = os.path.join(sub, fn) if sub else fn
+                yield root_idx, rel, rel if root_idx == 0 else os.path.join(abs_lib_dir, rel), os.path.join(root, fn)
+
+
+def _content_digest(per_path: str) -> str | None:
+    try:
+        with _mapped_file(per_path) as buf:
+            return hashlib.sha1(buf).hexdigest()
+    except OSError:
+        return None
+
+
+def scan_veecad_outlines(lib_dir, cache_dir: str | None = None, rebuild_index: bool = False, jobs: int = 1, stats: dict | None = None, index: dict | None = None, lazy_pins: bool = False, names: set | None = None, io_threads: int = 0, log=print):
+    """
+    Scan .per files for outline names. Returns:
+      - outlines: dict[name] -> OutlineInfo (files, pin_names, pin_count, sizes)
+      - outlines_by_file: dict[per_rel] -> sorted tuple of names
+    `lib_dir` may be a list of library roots in precedence order: an outline
+    defined in an earlier root shadows the same name in later ones, whose files
+    are still listed but add no pins. Files of later roots are keyed by
+    absolute path.
+    With cache_dir, per-file parse results are kept in an on-disk index (one
+    per root) keyed by path, size and mtime so only new or changed files are
+    re-parsed; rebuild_index ignores the existing index and rescans everything.
+    Files to parse are hashed as they are read and each distinct content is
+    parsed once; copies are attached to the same records without another pin
+    merge. Before a process pool starts, only files whose size matches another
+    file to parse are hashed, since no other file can be a copy.
+    With jobs > 1 (0 = all cores), files are parsed in a process pool; results are
+    still merged in walk order so the output does not depend on scheduling.
+    Otherwise, io_threads > 0 walks the tree in a background thread while that
+    many reader threads prefetch file contents for the parser (see _read_ahead),
+    so slow or network storage is read while earlier files are parsed.
+    If `stats` is given, scan counters (files walked, index hits, duplicate
+    files, JSON vs text parses, failures, outlines found) are added to it.
+    `index` is an in-memory per-file index (same layout as the on-disk one, keyed
+    by catalog key) that is consulted first and updated in place, for
+    long-running callers like --watch.
+    With lazy_pins, new files are indexed by outline name only and each
+    OutlineInfo parses its pin details from the source file on first access.
+    `names` limits the returned catalog to those outline names; the index is
+    still kept for every file. A failure to save the index is reported to `log`.
+    """
+    outlines: dict[str, OutlineInfo] = {}
+    outlines_by_file: dict[str, tuple[str, ...]] = {}
+    file_table: list[str] = []
+    roots = library_roots(lib_dir)
+    for root in roots:
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"VeeCAD library directory not found: {root}")
+
+    # In-memory entries are keyed by catalog key, on-disk ones by path within their root
+    disk_indexes = [{} for _root in roots]
+    if not rebuild_index and not index and cache_dir is not None:
+        disk_indexes = [load_outline_index(cache_dir, root) for root in roots]
+    memory_index = index if index and not rebuild_index else None
+    new_indexes = [{} for _root in roots]
+    keep_records = cache_dir is not None or index is not None
+    dirty_roots = set(range(len(roots))) if cache_dir is not None and rebuild_index else set()
+
+    hits = [0] * len(roots)
+    walked_count = [0]
+
+    def walk():
+        # [root, rel, key, path, stat, records, digest, cached] in walk order; records
+        # and digest come from the index on a hit and are filled in by resolve() otherwise
+        for root_idx, rel, key, per_path in _walk_per_files(roots):
+            try:
+                st = os.stat(per_path)
+            except OSError:
+                continue
+            walked_count[0] += 1
+            entry = memory_index.get(key) if memory_index is not None else disk_indexes[root_idx].get(rel)
+            if (
+                entry
+                and entry.get("size") == st.st_size
+                and entry.get("mtime_ns") == st.st_mtime_ns
+                # Name-only entries from a lazy scan cannot serve a full scan
+                and (lazy_pins or not entry.get("lazy"))
+            ):
+                hits[root_idx] += 1
+                yield [root_idx, rel, key, per_path, st, entry["outlines"], entry.get("sha1"), True]
+            else:
+                yield [root_idx, rel, key, per_path, st, None, None, False]
+
+    # Each distinct content is parsed once; copies share the first copy's records
+    first_copies = {}
+    _count(stats, "duplicate_files", 0)
+
+    def resolve(item, buf) -> None:
+        digest = hashlib.sha1(buf).hexdigest()
+        item[6] = digest
+        first = first_copies.get(digest)
+        if first is not None:
+            item[5] = first[5]
+            _count(stats, "duplicate_files")
+            return
+        item[5] = _parse_per_buffer(buf, stats, lazy_pins)
+        first_copies[digest] = item
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs > 1:
+        walked = list(walk())
+        misses = [item for item in walked if not item[7]]
+        same_size = defaultdict(int)
+        for item in misses:
+            same_size[item[4].st_size] += 1
+        to_parse = []
+        copies = []
+        for item in misses:
+            # Only a file whose size collides can be a copy; the rest are hashed by the workers
+            if same_size[item[4].st_size] > 1:
+                item[6] = _content_digest(item[3])
+                if item[6] is not None and item[6] in first_copies:
+                    copies.append(item)
+                    continue
+                if item[6] is not None:
+                    first_copies[item[6]] = item
+            to_parse.append(item)
+        _count(stats, "duplicate_files", len(copies))
+        parse = functools.partial(_parse_per_file, lazy=lazy_pins)
+        paths = [item[3] for item in to_parse]
+        if len(to_parse) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=min(jobs, len(to_parse))) as pool:
+                parsed = list(pool.map(parse, paths, chunksize=max(1, len(to_parse) // (jobs * 4))))
+        else:
+            parsed = [parse(path) for path in paths]
+        for item, (records, digest, file_stats) in zip(to_parse, parsed):
+            item[5] = records
+            if item[6] is None:
+                item[6] = digest
+            for name, n in file_stats.items():
+                _count(stats, name, n)
+        for item in copies:
+            item[5] = first_copies[item[6]][5]
+        resolved = walked
+    elif io_threads > 0:
+        def prefetched():
+            for item, data in _read_ahead(walk(), io_threads):
+                if not item[7]:
+                    if data is None:
+                        _count(stats, "read_failures")
+                    else:
+                        resolve(item, data)
+                yield item
+
+        resolved = prefetched()
+    else:
+        def in_order():
+            for item in walk():
+                if not item[7]:
+                    try:
+                        with _mapped_file(item[3]) as buf:
+                            resolve(item, buf)
+                    except OSError:
+                        _count(stats, "read_failures")
+                yield item
+
+        resolved = in_order()
+    loader = _LazyPinLoader(roots[0], file_table) if lazy_pins else None
+
+    merged_digests = set()
+    shadowed = set()
+    current_root = 0
+    for root_idx, rel, key, _per_path, st, records, digest, cached in resolved:
+        if root_idx != current_root:
+            # Everything defined so far belongs to roots with higher precedence
+            shadowed = set(outlines)
+            current_root = root_idx
+        if records is None:
+            continue
+        if not cached:
+            dirty_roots.add(root_idx)
+        if keep_records:
+            new_entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "outlines": records}
+            if digest is not None:
+                new_entry["sha1"] = digest
+            if any(r[1] is None for r in records):
+                new_entry["lazy"] = True
+            new_indexes[root_idx][rel] = new_entry
+        duplicate = digest is not None and digest in merged_digests
+        if digest is not None:
+            merged_digests.add(digest)
+        _merge_outline_records(outlines, outlines_by_file, file_table, key, records, loader, names, duplicate, shadowed)
+
+    # Freeze pin names/file IDs and finalize pin_count from pin_names
+    _finalize_outlines(outlines, outlines_by_file)
+    _count(stats, "files_walked", walked_count[0])
+    if any(hits):
+        _count(stats, "index_hits", sum(hits))
+    _count(stats, "outlines_found", len(outlines))
+
+    # Old entries that were not hits belong to changed or removed files
+    if memory_index is not None:
+        if len(memory_index) != sum(hits):
+            dirty_roots.update(range(len(roots)))
+    else:
+        dirty_roots.update(i for i, old in enumerate(disk_indexes) if len(old) != hits[i])
+    if cache_dir is not None:
+        for root_idx in sorted(dirty_roots):
+            root = roots[root_idx]
+            try:
+                save_outline_index(cache_dir, root, new_indexes[root_idx])
+            except OSError as e:
+                log(f"Warning: could not write outline index to {cache_dir}: {e}")
+    if index is not None:
+        index.clear()
+        for root_idx, root_index in enumerate(new_indexes):
+            for rel, entry in root_index.items():
+                index[rel if root_idx == 0 else os.path.abspath(os.path.join(roots[root_idx], rel))] = entry
     return outlines, outlines_by_file
 
 
-def parse_netlist_headers(lines):
+def library_signature(lib_dir) -> dict:
+    """Stat-only fingerprint of one or more library roots: dict[key] -> (size, mtime_ns). No file is read."""
+    signature = {}
+    for _root_idx, _rel, key, per_path in _walk_per_files(library_roots(lib_dir)):
+        try:
+            st = os.stat(per_path)
+        except OSError:
+            continue
+        signature[key] = (st.st_size, st.st_mtime_ns)
+    return signature
+
+
+class NetlistParseError(ValueError):
+    """Raised for malformed component blocks; carries the 1-based line number."""
+
+    def __init__(self, line_number: int, message: str):
+        super().__init__(f"line {line_number}: {message}")
+        self.line_number = line_number
+
+
+def iter_netlist_components(lines):
     """
-    Parse lines, yielding dicts for component header lines with token spans.
-    Keeps original line text and indices to allow precise in-place token replacement.
+    Stream component records from an Eeschema 1.1 netlist in a single pass.
+    Accepts any iterable of lines (a list or an open file). Each record holds the
+    header line, its index, uuid/footprint/ref/value with token spans, the pad
+    list as (pad, net) tuples, pin_count and the index of the closing ')'.
+    Raises NetlistParseError when a component block or header line is cut short,
+    or when the enclosing netlist list is not closed (a file still being written).
     """
-    headers = []
+    current = None
+    # Line index of the unclosed "( { EESchema Netlist" list, if any
+    open_list = None
     for idx, line in enumerate(lines):
-        m = COMPONENT_HEADER_RE.match(line)
-        if not m:
+        if current is None:
+            m = COMPONENT_HEADER_RE.match(line)
+            if m:
+                current = {
+                    "line_index": idx,
+                    "line": line,
+                    "uuid": m.group("uuid"),
+                    "footprint": m.group("footprint"),
+                    "ref": m.group("ref"),
+                    "value": m.group("value"),
+                    # Capture spans so we can preserve spacing
+                    "uuid_span": m.span("uuid"),
+                    "footprint_span": m.span("footprint"),
+                    "ref_span": m.span("ref"),
+                    "value_span": m.span("value"),
+                    "pads": [],
+                }
+            elif COMPONENT_START_RE.match(line):
+                raise NetlistParseError(idx + 1, "component header is incomplete")
+            elif open_list is None:
+                if NETLIST_START_RE.match(line):
+                    open_list = idx
+            elif line.strip() == ")":
+                open_list = None
             continue
-        # Capture spans so we can preserve spacing
-        footprint_span = m.span("footprint")
-        headers.append({
-            "line_index": idx,
-            "line": line,
-            "uuid": m.group("uuid"),
-            "footprint": m.group("footprint"),
-            "ref": m.group("ref"),
-            "value": m.group("value"),
-            "footprint_span": footprint_span,
-        })
-    return headers
-
-
-def compute_component_pin_counts(headers, lines):
-    """
-    Determine pin count per component by counting subsequent pad lines until the closing ')'.
-    Assumes header at line i, with following lines like '  (    1 Net-... )' until a lone ')' line.
-    """
-    pin_counts = {}
-    for h in headers:
-        idx = h["line_index"]
-        count = 0
-        j = idx + 1
-        while j < len(lines):
-            line = lines[j]
-            if line.strip() == ')':
-                break
-            # A pad line looks like: (    1 Net-... )
-            if line.lstrip().startswith('('):
-                # Count only lines that start with '(' and contain a pin number as first token
-                # Quick heuristic: after '(', there is whitespace then a number
-                m = re.match(r"^\s*\(\s*([0-9A-Za-z]+)\b", line)
-                if m:
-                    count += 1
-            j += 1
-        pin_counts[h["ref"]] = count
-    return pin_counts
+        if line.strip() == ")":
+            current["pin_count"] = len(current["pads"])
+            current["end_index"] = idx
+            yield current
+            current = None
+            continue
+        if COMPONENT_START_RE.match(line):
+            raise NetlistParseError(
+                current["line_index"] + 1,
+                f"component {current['ref']} is not terminated before the next component header at line {idx + 1}",
+            )
+        # A pad line looks like: (    1 Net-... )
+        m = PAD_LINE_RE.match(line)
+        if m:
+            current["pads"].append((m.group("pad"), m.group("net")))
+    if current is not None:
+        raise NetlistParseError(
+            current["line_index"] + 1,
+            f"component {current['ref']} is not terminated before end of file",
+        )
+    if open_list is not None:
+        raise NetlistParseError(open_list + 1, "netlist is not closed before end of file")
+
+
+def parse_netlist_headers(lines):
+    """
+    Parse lines, returning dicts for component header lines with token spans.
+    Keeps original line text and indices to allow precise in-place token replacement.
+    """
+    return list(iter_netlist_components(lines))
+
+
+def compute_component_pin_counts(headers, lines=None):
+    """
+    Pin count per ref, taken from the pad lists collected while parsing.
+    `lines` is accepted for compatibility; no second pass over the netlist is made.
+    """
+    return {h["ref"]: h["pin_count"] for h in headers}
 
 
 def group_by_current_footprint(headers):
@@ -280,24 +1134,403 @@ def group_by_current_footprint(headers):
     return grouping
 
 
-def print_compact_list(items, max_items=30):
-    for i, item in enumerate(items[:max_items], start=1):
-        print(f"  {i:2d}) {item}")
-    if len(items) > max_items:
-        print(f"  ... and {len(items) - max_items} more")
+SEXPR_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))', re.DOTALL)
+SEXPR_ESCAPE_RE = re.compile(r"\\(.)", re.DOTALL)
+SEXPR_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+def iter_sexpr_tokens(f, chunk_size: int = 1 << 20):
+    """
+    Incrementally tokenize an S-expression text stream. Yields ("(", None),
+    (")", None) and ("atom", text) with quoted strings unescaped. Reads
+    `chunk_size` characters at a time, so memory does not grow with the file.
+    """
+    buf = ""
+    pos = 0
+    eof = False
+    while True:
+        m = SEXPR_TOKEN_RE.match(buf, pos)
+        # A token touching the end of the buffer may continue in the next chunk
+        if (m is None or m.end() == len(buf)) and not eof:
+            chunk = f.read(chunk_size)
+            buf = buf[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            continue
+        if m is None:
+            if buf[pos:].strip():
+                raise ValueError(f"unterminated or invalid S-expression token: {buf[pos:pos + 40]!r}")
+            return
+        pos = m.end()
+        if m.group(1):
+            yield "(", None
+        elif m.group(2):
+            yield ")", None
+        elif m.group(3) is not None:
+            text = m.group(3)
+            if "\\" in text:
+                text = SEXPR_ESCAPE_RE.sub(lambda e: SEXPR_ESCAPES.get(e.group(1), e.group(1)), text)
+            yield "atom", text
+        else:
+            yield "atom", m.group(4)
+
+
+def _read_sexpr_list(tokens, head: str) -> list:
+    """Materialize the rest of a list whose "(" and head atom were consumed: [head, items...]."""
+    root = [head]
+    stack = [root]
+    for kind, text in tokens:
+        if kind == "atom":
+            stack[-1].append(text)
+        elif kind == "(":
+            node = []
+            stack[-1].append(node)
+            stack.append(node)
+        else:
+            stack.pop()
+            if not stack:
+                return root
+    raise ValueError(f"unterminated ({head} ...) list")
+
+
+def _skip_sexpr_list(tokens) -> None:
+    depth = 1
+    for kind, _text in tokens:
+        if kind == "(":
+            depth += 1
+        elif kind == ")":
+            depth -= 1
+            if depth == 0:
+                return
+    raise ValueError("unterminated list")
 
 
-def pick_outline_interactive(current_fp, refs, outlines_dict, outlines_by_file, preferred_files, required_pin_count: int | None):
-    names = sorted(outlines_dict.keys(), key=lambda s: (s.lower()))
+def iter_sexpr_nodes(tokens, paths):
+    """
+    Stream the lists at the given head paths, e.g. ("kicad_sch", "symbol"), as
+    (head path, nested Python list) pairs, one subtree at a time. Subtrees that cannot contain a
+    wanted path are skipped without being built.
+    """
+    tokens = iter(tokens)
+    paths = set(paths)
+    prefixes = {p[:i] for p in paths for i in range(1, len(p))}
+    stack = []
+    for kind, _text in tokens:
+        if kind == ")":
+            if stack:
+                stack.pop()
+            continue
+        if kind != "(":
+            continue
+        head_kind, head = next(tokens, (None, None))
+        if head_kind != "atom":
+            raise ValueError("expected a list head after '('")
+        stack.append(head)
+        key = tuple(stack)
+        if key in paths:
+            yield key, _read_sexpr_list(tokens, head)
+            stack.pop()
+        elif key not in prefixes:
+            _skip_sexpr_list(tokens)
+            stack.pop()
+
+
+def _sexpr_children(node: list, head: str):
+    return [c for c in node[1:] if isinstance(c, list) and c and c[0] == head]
+
+
+def _sexpr_value(node: list, head: str, default=None):
+    """First atom of the first (head value ...) child of node."""
+    for c in node[1:]:
+        if isinstance(c, list) and len(c) > 1 and c[0] == head and isinstance(c[1], str):
+            return c[1]
+    return default
 
+
+def _sexpr_properties(node: list) -> dict:
+    return {c[1]: c[2] for c in _sexpr_children(node, "property") if len(c) > 2 and isinstance(c[1], str) and isinstance(c[2], str)}
+
+
+def parse_schematic_sheet(path: str) -> dict:
+    """
+    Stream one .kicad_sch file. Returns {"uuid", "symbols", "sheets"}: placed
+    symbols with uuid/reference/value/footprint, pin numbers and per-path
+    instance references; child sheets as (sheet uuid, sheet file) pairs.
+    """
+    sheet = {"uuid": None, "symbols": [], "sheets": []}
+    wanted = {("kicad_sch", "uuid"), ("kicad_sch", "symbol"), ("kicad_sch", "sheet")}
+    with open(path, "r", encoding="utf-8") as f:
+        for (_root, head), node in iter_sexpr_nodes(iter_sexpr_tokens(f), wanted):
+            if head == "uuid":
+                sheet["uuid"] = node[1] if len(node) > 1 else None
+                continue
+            props = _sexpr_properties(node)
+            if head == "sheet":
+                sheet_file = props.get("Sheetfile") or props.get("Sheet file")
+                if sheet_file:
+                    sheet["sheets"].append((_sexpr_value(node, "uuid"), sheet_file))
+                continue
+            instances = {}
+            for inst in _sexpr_children(node, "instances"):
+                for project in _sexpr_children(inst, "project"):
+                    for inst_path in _sexpr_children(project, "path"):
+                        ref = _sexpr_value(inst_path, "reference")
+                        if len(inst_path) > 1 and ref:
+                            instances[inst_path[1]] = ref
+            sheet["symbols"].append({
+                "uuid": _sexpr_value(node, "uuid", ""),
+                "ref": props.get("Reference", ""),
+                "value": props.get("Value", ""),
+                "footprint": props.get("Footprint", ""),
+                "pins": [c[1] for c in _sexpr_children(node, "pin") if len(c) > 1],
+                "instances": instances,
+            })
+    return sheet
+
+
+def _component_record(uuid: str, footprint: str, ref: str, value: str) -> dict:
+    """Component record shaped like iter_netlist_components() output, without line data."""
+    return {
+        "line_index": None,
+        "line": None,
+        "uuid": uuid,
+        # Same placeholder the legacy netlist exporter writes for an empty footprint
+        "footprint": footprint or "$noname",
+        "ref": ref,
+        "value": value,
+        "pads": [],
+        "pin_count": 0,
+    }
+
+
+def parse_schematic_components(path: str, max_workers: int | None = None) -> list:
+    """
+    Components of a schematic hierarchy rooted at `path`. Sheets are parsed
+    concurrently, one level of the hierarchy at a time, and each file once even
+    when it is instantiated several times. Power symbols (#PWR, #FLG) are left
+    out and units of one multi-unit part are merged, as in an exported netlist.
+    """
+    root_path = os.path.abspath(path)
+    parsed = {root_path: parse_schematic_sheet(root_path)}
+    root_uuid = parsed[root_path]["uuid"]
+    # (sheet file, instance path) in hierarchy order
+    instances = [(root_path, f"/{root_uuid}" if root_uuid else "/")]
+    level = instances
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+        while level:
+            children = []
+            for sheet_path, inst_path in level:
+                base = os.path.dirname(sheet_path)
+                for sheet_uuid, sheet_file in parsed[sheet_path]["sheets"]:
+                    children.append((os.path.abspath(os.path.join(base, sheet_file)), f"{inst_path}/{sheet_uuid}"))
+            todo = sorted({p for p, _inst in children if p not in parsed})
+            for sheet_path, sheet in zip(todo, pool.map(parse_schematic_sheet, todo)):
+                parsed[sheet_path] = sheet
+            instances.extend(children)
+            level = children
+
+    components = {}
+    for sheet_path, inst_path in instances:
+        for sym in parsed[sheet_path]["symbols"]:
+            ref = sym["instances"].get(inst_path) or sym["ref"]
+            if not ref or ref.startswith("#"):
+                continue
+            comp = components.get(ref)
+            if comp is None:
+                comp = components[ref] = _component_record(sym["uuid"], sym["footprint"], ref, sym["value"])
+                comp["sheet_path"] = inst_path
+                comp["_pins"] = set()
+            comp["_pins"].update(sym["pins"])
+    for comp in components.values():
+        comp["pads"] = [(pin, "") for pin in sorted(comp.pop("_pins"))]
+        comp["pin_count"] = len(comp["pads"])
+    return list(components.values())
+
+
+def parse_sexpr_netlist_components(path: str) -> list:
+    """
+    Components of a KiCad S-expression netlist ("(export (version ...)"), with
+    pads and net names taken from its (nets ...) section.
+    """
+    components = {}
+    wanted = {("export", "components", "comp"), ("export", "nets", "net")}
+    with open(path, "r", encoding="utf-8") as f:
+        for (_root, _section, head), node in iter_sexpr_nodes(iter_sexpr_tokens(f), wanted):
+            if head == "comp":
+                ref = _sexpr_value(node, "ref", "")
+                # KiCad 7+ writes (tstamps ...), KiCad 6 (tstamp ...)
+                uuid = _sexpr_value(node, "tstamps") or _sexpr_value(node, "tstamp", "")
+                components[ref] = _component_record(uuid, _sexpr_value(node, "footprint", ""), ref, _sexpr_value(node, "value", ""))
+                continue
+            net_name = _sexpr_value(node, "name", "")
+            for pad_node in _sexpr_children(node, "node"):
+                comp = components.get(_sexpr_value(pad_node, "ref"))
+                if comp is not None:
+                    comp["pads"].append((_sexpr_value(pad_node, "pin", ""), net_name))
+    for comp in components.values():
+        comp["pin_count"] = len(comp["pads"])
+    return list(components.values())
+
+
+def detect_netlist_format(path: str) -> str:
+    """"kicad_sch", "kicad_net" (S-expression netlist) or "legacy" (Eeschema 1.1)."""
+    if path.lower().endswith(".kicad_sch"):
+        return "kicad_sch"
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            head = f.read(256)
+    except OSError:
+        return "legacy"
+    return "kicad_net" if re.match(r"\s*\(\s*export\b", head) else "legacy"
+
+
+class OutlineSearchIndex:
+    """
+    Name lookups over the outline catalog, built once after the scan.
+    Positions refer to `names` (sorted case-insensitively, as the prompt lists them),
+    so every query returns names in the same order as a linear scan of `names`.
+    """
+
+    def __init__(self, outlines_dict: dict, pin_index: dict | None = None):
+        self.names = sorted(outlines_dict.keys(), key=lambda s: (s.lower()))
+        self._lower = [n.lower() for n in self.names]
+        # Lowercase trigram -> ascending positions
+        self._trigrams: dict[str, list[int]] = defaultdict(list)
+        for pos, low in enumerate(self._lower):
+            for gram in {low[i:i + 3] for i in range(len(low) - 2)}:
+                self._trigrams[gram].append(pos)
+        # Uppercase names in sorted order for prefix range lookups
+        by_upper = sorted((n.upper(), pos) for pos, n in enumerate(self.names))
+        self._upper_keys = [u for u, _pos in by_upper]
+        self._upper_pos = [pos for _u, pos in by_upper]
+        # Pin counts are read on demand so lazily scanned outlines stay unparsed
+        self._outlines = outlines_dict
+        # With index_outlines_by_pins() buckets the pin filter is a set lookup instead
+        self._by_pin_count = pin_index["by_pin_count"] if pin_index is not None else None
+        self._pin_count_sets: dict[int, frozenset] = {}
+
+    def substring(self, query: str) -> list[str]:
+        """Names containing `query` (case-insensitive)."""
+        q = query.lower()
+        if len(q) < 3:
+            return [n for n, low in zip(self.names, self._lower) if q in low]
+        # Verify only the rarest trigram's postings; they are already in name order
+        grams = {q[i:i + 3] for i in range(len(q) - 2)}
+        postings = min((self._trigrams.get(g, []) for g in grams), key=len)
+        return [self.names[pos] for pos in postings if q in self._lower[pos]]
+
+    def prefix(self, prefix: str) -> list[str]:
+        """Names starting with `prefix` (case-insensitive)."""
+        p = prefix.upper()
+        lo = bisect.bisect_left(self._upper_keys, p)
+        hi = lo
+        while hi < len(self._upper_keys) and self._upper_keys[hi].startswith(p):
+            hi += 1
+        return [self.names[pos] for pos in sorted(self._upper_pos[lo:hi])]
+
+    def pin_count(self, name: str) -> int:
+        info = self._outlines.get(name)
+        return info.pin_count if info is not None else 0
+
+    def filter_pin_count(self, names, required_pin_count: int) -> list[str]:
+        """Keep names whose pin count is unknown (0) or equals required_pin_count."""
+        if self._by_pin_count is None:
+            return [n for n in names if self.pin_count(n) in (0, required_pin_count)]
+        allowed = self._pin_count_sets.get(required_pin_count)
+        if allowed is None:
+            allowed = frozenset(self._by_pin_count.get(required_pin_count, ())).union(self._by_pin_count.get(0, ()))
+            self._pin_count_sets[required_pin_count] = allowed
+        return [n for n in names if n in allowed]
+
+
+def _outline_label(name: str, outlines_dict: dict) -> str:
+    info = outlines_dict.get(name)
+    return info.label if info is not None else name
+
+
+# How many entries the prompt, /filter and * listings show
+CANDIDATES_SHOWN = 40
+FILTERED_SHOWN = 80
+ALL_OUTLINES_SHOWN = 200
+
+NAME_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+FOOTPRINT_DIAMETER_RE = re.compile(r"_d(\d+(?:\.\d+)?)mm", re.IGNORECASE)
+FOOTPRINT_PITCH_RE = re.compile(r"_p(\d+(?:\.\d+)?)mm", re.IGNORECASE)
+
+
+def rank_outline_candidates(current_fp: str, names, outlines_dict: dict, k: int, required_pin_count: int | None = None, preferred_files=(), outlines_by_file: dict | None = None, geometry_fits=None) -> list[str]:
+    """
+    The `k` best of `names` for `current_fp`, best first, picked with a heap.
+    The score adds up pad-geometry fits, name token overlap, pin-count match,
+    pitch/diameter agreement with the footprint name and preferred-library
+    rank; ties keep the order of `names`.
+    """
+    fp_lower = current_fp.lower()
+    fp_tokens = set(NAME_TOKEN_RE.findall(fp_lower))
+    pitch_m = FOOTPRINT_PITCH_RE.search(fp_lower)
+    pitch = float(pitch_m.group(1)) if pitch_m else None
+    dia_m = FOOTPRINT_DIAMETER_RE.search(fp_lower)
+    diameter = float(dia_m.group(1)) if dia_m else None
+    fit_rms = {name: rms for rms, name in geometry_fits or ()}
+    preferred_rank = {}
+    for rank, rel in enumerate(preferred_files):
+        for name in (outlines_by_file or {}).get(rel, ()):
+            preferred_rank.setdefault(name, rank)
+
+    def score(name: str) -> float:
+        total = 0.0
+        if name in fit_rms:
+            # Geometry fits outrank everything else, best fit first
+            total += 10.0 - fit_rms[name]
+        tokens = set(NAME_TOKEN_RE.findall(name.lower()))
+        if tokens:
+            total += 3.0 * len(tokens & fp_tokens) / len(tokens)
+        info = outlines_dict.get(name)
+        if info is None:
+            return total
+        if required_pin_count is not None:
+            count = info.pin_count
+            if count == required_pin_count:
+                total += 2.0
+            elif count:
+                total -= 2.0
+        sizes = info.sizes or {}
+        if pitch is not None and sizes.get("pitch_mm") is not None and abs(sizes["pitch_mm"] - pitch) < 0.05:
+            total += 1.5
+        if diameter is not None and sizes.get("diameter_mm") is not None and abs(sizes["diameter_mm"] - diameter) < 0.05:
+            total += 1.5
+        if name in preferred_rank:
+            total += 1.0 - preferred_rank[name] / len(preferred_files)
+        return total
+
+    return heapq.nlargest(k, names, key=score)
+
+
+def _print_ranked(ranked: list[str], total: int, outlines_dict: dict, labels: dict | None = None, annotate: bool = True) -> None:
+    """Print a ranked list; only these entries are labelled (pin counts load lazily)."""
+    for i, name in enumerate(ranked, start=1):
+        label = _outline_label(name, outlines_dict) if annotate else name
+        if labels and name in labels:
+            label = f"{label} {labels[name]}"
+        print(f"  {i:2d}) {label}")
+    if total > len(ranked):
+        print(f"  ... and {total - len(ranked)} more (use /text to narrow the list)")
+
+
+def outline_candidates(current_fp, outlines_dict, outlines_by_file, preferred_files, required_pin_count: int | None, search_index: OutlineSearchIndex, geometry_fits: list | None = None, k: int = CANDIDATES_SHOWN):
+    """
+    The outlines offered for `current_fp`, best first: at most `k` of them
+    plus the size of the pool they were ranked from.
+    """
     # Candidate generation
     candidates = []
-    lower = current_fp.lower()
     if current_fp in outlines_dict:
         candidates = [current_fp]
     else:
         # Prefer names containing the token
-        candidates = [n for n in names if lower in n.lower()]
+        candidates = search_index.substring(current_fp)
 
         # If no candidates, prefer outlines from preferred library files
         if not candidates and preferred_files:
@@ -317,7 +1550,7 @@ def pick_outline_interactive(current_fp, refs, outlines_dict, outlines_by_file,
         if not candidates:
             common_prefixes = ["DIP", "SIP", "TO", "AX", "CAP", "LED", "RES", "HDR"]
             for p in common_prefixes:
-                candidates.extend([n for n in names if n.upper().startswith(p)])
+                candidates.extend(search_index.prefix(p))
             # Deduplicate
             seen = set()
             dedup = []
@@ -329,16 +1562,28 @@ def pick_outline_interactive(current_fp, refs, outlines_dict, outlines_by_file,
 
     # Filter by pin count if requested and known
     if required_pin_count is not None:
-        filtered = []
-        for n in candidates:
-            info = outlines_dict.get(n)
-            pin_count = 0
-            if isinstance(info, dict):
-                pin_count = info.get("pin_count", 0)
-            if pin_count == 0 or pin_count == required_pin_count:
-                filtered.append(n)
+        filtered = search_index.filter_pin_count(candidates, required_pin_count)
         candidates = filtered if filtered else candidates
 
+    # Outlines that fit the board's pads always compete, whatever the name says
+    fit_labels = {name: f"[fits pads, {rms:.2f}]" for rms, name in geometry_fits or ()}
+    if fit_labels:
+        candidates = [name for _rms, name in geometry_fits] + [n for n in candidates if n not in fit_labels]
+    ranked = rank_outline_candidates(current_fp, candidates, outlines_dict, k, required_pin_count, preferred_files, outlines_by_file, geometry_fits)
+    return ranked, len(candidates)
+
+
+def pick_outline_interactive(current_fp, refs, outlines_dict, outlines_by_file, preferred_files, required_pin_count: int | None, search_index: OutlineSearchIndex | None = None, geometry_fits: list | None = None):
+    if search_index is None:
+        search_index = OutlineSearchIndex(outlines_dict)
+    names = search_index.names
+    fit_labels = {name: f"[fits pads, {rms:.2f}]" for rms, name in geometry_fits or ()}
+
+    def rank(pool, k, pin_count=None):
+        return rank_outline_candidates(current_fp, pool, outlines_dict, k, pin_count, preferred_files, outlines_by_file, geometry_fits)
+
+    candidates, pool_size = outline_candidates(current_fp, outlines_dict, outlines_by_file, preferred_files, required_pin_count, search_index, geometry_fits)
+
     print()
     print(f"Footprint: {current_fp}")
     print(f"  Used by refs (examples): {', '.join(refs[:8])}{'...' if len(refs) > 8 else ''}")
@@ -350,34 +1595,7 @@ def pick_outline_interactive(current_fp, refs, outlines_dict, outlines_by_file,
     else:
         print("Choose one of the following outlines (enter number).")
         # Show pin counts and inferred sizes next to names
-        annotated = []
-        for n in candidates:
-            info = outlines_dict.get(n)
-            pc = 0
-            size = ""
-            if isinstance(info, dict):
-                pc = info.get("pin_count", 0)
-                sizes = info.get("sizes") or {}
-                if sizes.get("size_label"):
-                    size = sizes["size_label"]
-                elif sizes.get("pitch_mm") or sizes.get("diameter_mm"):
-                    pitch = sizes.get("pitch_mm")
-                    dia = sizes.get("diameter_mm")
-                    parts = []
-                    if dia:
-                        parts.append(f"D={dia:g}mm")
-                    if pitch:
-                        parts.append(f"P={pitch:g}mm")
-                    if parts:
-                        size = ", ".join(parts)
-            suffix = []
-            if pc:
-                suffix.append(f"{pc} pins")
-            if size:
-                suffix.append(size)
-            label = f"{n} ({'; '.join(suffix)})" if suffix else f"{n}"
-            annotated.append(label)
-        print_compact_list(annotated, max_items=40)
+        _print_ranked(candidates, pool_size, outlines_dict, fit_labels)
 
     while True:
         raw = input("Enter selection [number], 0=keep original, *=list all, /=filter, or type name: ").strip()
@@ -385,44 +1603,16 @@ def pick_outline_interactive(current_fp, refs, outlines_dict, outlines_by_file,
             return None  # keep original
         if raw == "*":
             print("All outlines:")
-            print_compact_list(names, max_items=200)
+            # Pin counts are left out so a lazily scanned library stays unparsed
+            _print_ranked(rank(names, ALL_OUTLINES_SHOWN), len(names), outlines_dict, annotate=False)
             continue
         if raw.startswith("/"):
-            q = raw[1:].strip().lower()
-            filtered = [n for n in names if q in n.lower()]
+            filtered = search_index.substring(raw[1:].strip())
             if not filtered:
                 print("No matches.")
             else:
-                # Annotate
-                annotated = []
-                for n in filtered:
-                    info = outlines_dict.get(n)
-                    pc = 0
-                    size = ""
-                    if isinstance(info, dict):
-                        pc = info.get("pin_count", 0)
-                        sizes = info.get("sizes") or {}
-                        if sizes.get("size_label"):
-                            size = sizes["size_label"]
-                        elif sizes.get("pitch_mm") or sizes.get("diameter_mm"):
-                            pitch = sizes.get("pitch_mm")
-                            dia = sizes.get("diameter_mm")
-                            parts = []
-                            if dia:
-                                parts.append(f"D={dia:g}mm")
-                            if pitch:
-                                parts.append(f"P={pitch:g}mm")
-                            if parts:
-                                size = ", ".join(parts)
-                    suffix = []
-                    if pc:
-                        suffix.append(f"{pc} pins")
-                    if size:
-                        suffix.append(size)
-                    label = f"{n} ({'; '.join(suffix)})" if suffix else f"{n}"
-                    annotated.append(label)
                 print("Filtered:")
-                print_compact_list(annotated, max_items=80)
+                _print_ranked(rank(filtered, FILTERED_SHOWN, required_pin_count), len(filtered), outlines_dict, fit_labels)
             continue
         if raw.isdigit():
             sel = int(raw)
@@ -442,126 +1632,1492 @@ def pick_outline_interactive(current_fp, refs, outlines_dict, outlines_by_file,
             continue
 
 
-def choose_preferred_lib_files_for_refs(ref_examples, lib_dir, outlines_by_file):
-    preferred = []
-    if any(r.upper().startswith("C") for r in ref_examples):
-        # Capacitor libraries
-        for rel in outlines_by_file.keys():
-            if "capacitor" in rel.lower():
-                preferred.append(rel)
-    if any(r.upper().startswith("U") for r in ref_examples):
-        for rel in outlines_by_file.keys():
-            if os.path.basename(rel).lower().startswith("v_standard"):
-                preferred.append(rel)
-    if any(r.upper().startswith("R") for r in ref_examples):
-        for rel in outlines_by_file.keys():
-            if os.path.basename(rel).lower().startswith("v_standard"):
-                preferred.append(rel)
-    if any(r.upper().startswith("J") for r in ref_examples):
-        # Headers/connectors likely in standard as well
-        for rel in outlines_by_file.keys():
-            base = os.path.basename(rel).lower()
-            if base.startswith("v_standard") or "header" in base:
-                preferred.append(rel)
-    # Deduplicate keeping order
-    seen = set()
-    ordered = []
-    for r in preferred:
-        if r not in seen:
-            seen.add(r)
-            ordered.append(r)
-    return ordered
+# Library file groups; each test is a list of case-insensitive substrings/prefixes
+DEFAULT_LIBRARY_GROUPS = {
+    "capacitor": {"path_contains": ["capacitor"]},
+    "standard": {"basename_prefix": ["v_standard"]},
+    "header": {"basename_contains": ["header"]},
+}
 
+# Reference prefix -> library groups preferred for it, in prompt order
+DEFAULT_REF_PREFIX_GROUPS = {
+    "C": ["capacitor"],
+    "U": ["standard"],
+    "R": ["standard"],
+    "J": ["standard", "header"],
+}
 
-def auto_map_outline(current_fp: str, outlines: dict) -> str | None:
-    fp_lower = current_fp.lower()
+LIBRARY_GROUP_TESTS = ("path_contains", "basename_prefix", "basename_contains")
+
+
+class LibraryPreferenceIndex:
+    """
+    Library files classified once per scan into named groups, plus the ordered
+    reference-prefix -> groups rules. preferred_files() is a dict lookup on the
+    set of prefixes the refs match. Config keys: 'library_groups' adds or
+    replaces groups, 'ref_prefix_groups' adds or replaces prefix rules.
+    """
+
+    def __init__(self, outlines_by_file: dict, groups: dict | None = None, prefix_groups: dict | None = None):
+        groups = DEFAULT_LIBRARY_GROUPS if groups is None else groups
+        prefix_groups = DEFAULT_REF_PREFIX_GROUPS if prefix_groups is None else prefix_groups
+        for name, tests in groups.items():
+            if not isinstance(tests, dict) or not tests:
+                raise ValueError(f"library group '{name}' must be an object with {', '.join(LIBRARY_GROUP_TESTS)}")
+            for key, values in tests.items():
+                if key not in LIBRARY_GROUP_TESTS:
+                    raise ValueError(f"library group '{name}': unknown test '{key}'")
+                if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+                    raise ValueError(f"library group '{name}': '{key}' must be a list of strings")
+        self.prefix_rules = []
+        for prefix, group_names in prefix_groups.items():
+            if not isinstance(group_names, list) or not all(g in groups for g in group_names):
+                raise ValueError(f"ref prefix '{prefix}' must list known library groups")
+            self.prefix_rules.append((prefix.upper(), tuple(group_names)))
+
+        # Group membership per file, in library file order
+        self.file_groups: dict[str, frozenset] = {}
+        for rel in outlines_by_file:
+            path = rel.lower()
+            base = os.path.basename(path)
+            self.file_groups[rel] = frozenset(
+                name
+                for name, tests in groups.items()
+                if any(v.lower() in path for v in tests.get("path_contains", ()))
+                or any(base.startswith(v.lower()) for v in tests.get("basename_prefix", ()))
+                or any(v.lower() in base for v in tests.get("basename_contains", ()))
+            )
+        self._cache: dict[tuple, tuple] = {}
+
+    @classmethod
+    def from_config(cls, outlines_by_file: dict, config: dict | None) -> "LibraryPreferenceIndex":
+        config = config or {}
+        groups = config.get("library_groups", {})
+        prefix_groups = config.get("ref_prefix_groups", {})
+        if not isinstance(groups, dict) or not isinstance(prefix_groups, dict):
+            raise ValueError("'library_groups' and 'ref_prefix_groups' must be objects")
+        # User entries replace built-ins of the same name; new prefixes go last
+        return cls(outlines_by_file, {**DEFAULT_LIBRARY_GROUPS, **groups}, {**DEFAULT_REF_PREFIX_GROUPS, **prefix_groups})
+
+    def preferred_files(self, ref_examples) -> tuple:
+        refs = [r.upper() for r in ref_examples]
+        key = tuple(i for i, (prefix, _groups) in enumerate(self.prefix_rules) if any(r.startswith(prefix) for r in refs))
+        cached = self._cache.get(key)
+        if cached is None:
+            ordered = {}
+            for i in key:
+                wanted = self.prefix_rules[i][1]
+                for rel, file_groups in self.file_groups.items():
+                    if not file_groups.isdisjoint(wanted):
+                        ordered.setdefault(rel, None)
+            cached = self._cache[key] = tuple(ordered)
+        return cached
+
+
+def choose_preferred_lib_files_for_refs(ref_examples, lib_dir, outlines_by_file, preference_index: LibraryPreferenceIndex | None = None):
+    if preference_index is None:
+        preference_index = LibraryPreferenceIndex(outlines_by_file)
+    return list(preference_index.preferred_files(ref_examples))
+
+
+def index_outlines_by_pins(outlines: dict) -> dict:
+    """
+    Bucket outlines for O(1) compatibility lookups. Returns:
+      - by_pin_count: dict[int] -> sorted list of names
+      - by_pin_signature: dict[frozenset of pin names] -> sorted list of names
+    """
+    by_pin_count: dict[int, list[str]] = defaultdict(list)
+    by_pin_signature: dict[frozenset, list[str]] = defaultdict(list)
+    for name in sorted(outlines.keys(), key=lambda s: (s.lower())):
+        info = outlines[name]
+        by_pin_count[info.pin_count].append(name)
+        if info.pin_names:
+            by_pin_signature[info.pin_names].append(name)
+    return {"by_pin_count": dict(by_pin_count), "by_pin_signature": dict(by_pin_signature)}
+
+
+def auto_map_outline_by_pins(headers, pin_index: dict) -> str | None:
+    """Return the only outline whose pin names equal the components' pad set, if exactly one exists."""
+    pads = frozenset(pad for h in headers for pad, _net in h.get("pads", ()))
+    if not pads:
+        return None
+    matches = pin_index["by_pin_signature"].get(pads, [])
+    if len(matches) == 1:
+        return matches[0]
+    return None
+
+
+MM_PER_GRID = 2.54
+# RMS pin offset, in 0.1" grid units, up to which a footprint still fits an outline
+GEOMETRY_FIT_TOLERANCE = 0.25
+# Quarter turns as (a, b, c, d): x' = a*x + b*y, y' = c*x + d*y
+GEOMETRY_ROTATIONS = ((1, 0, 0, 1), (0, -1, 1, 0), (-1, 0, 0, -1), (0, 1, -1, 0))
+
+
+def _import_numpy():
+    """numpy if it is installed; geometry matching falls back to plain Python without it."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def load_pcb_footprint_pads(path: str) -> dict:
+    """
+    Pad positions per footprint from a .kicad_pcb, streamed like schematics:
+    {footprint name: {pad: (x_mm, y_mm)}} in footprint-local coordinates. The
+    first placement of a footprint wins; unnamed (mechanical) pads are skipped.
+    """
+    pads_by_fp = {}
+    wanted = {("kicad_pcb", "footprint"), ("kicad_pcb", "module")}
+    with open(path, "r", encoding="utf-8") as f:
+        for _key, node in iter_sexpr_nodes(iter_sexpr_tokens(f), wanted):
+            if len(node) < 2 or not isinstance(node[1], str) or node[1] in pads_by_fp:
+                continue
+            pads = {}
+            for pad in _sexpr_children(node, "pad"):
+                at = _sexpr_children(pad, "at")
+                if len(pad) < 2 or not pad[1] or not at or len(at[0]) < 3:
+                    continue
+                try:
+                    pads.setdefault(pad[1], (float(at[0][1]), float(at[0][2])))
+                except ValueError:
+                    continue
+            if pads:
+                pads_by_fp[node[1]] = pads
+    return pads_by_fp
+
+
+def _centered(points) -> list:
+    n = len(points)
+    cx = sum(x for x, _y in points) / n
+    cy = sum(y for _x, y in points) / n
+    return [(x - cx, y - cy) for x, y in points]
+
+
+class OutlineGeometryIndex:
+    """
+    Outline pin positions grouped by pin-name set, for scoring board footprints
+    (pads from load_pcb_footprint_pads) against the catalog. Both sides are
+    centred on their pins and compared in 0.1" grid units over the four quarter
+    turns. The squared distance |o - Rf|^2 expands to |o|^2 + |f|^2 - 2 o.Rf, so
+    each outline needs only its precomputed |o|^2 and four cross sums per
+    footprint. With numpy each group is one (outlines, pins, 2) array scored in a
+    single vectorized pass; without it the same arithmetic runs in Python.
+    """
+
+    def __init__(self, outlines: dict, footprint_pads: dict, np=None):
+        self.outlines = outlines
+        self.footprint_pads = footprint_pads
+        self.np = np
+        # Position arrays are only built for pin sets that some footprint asks for
+        self._by_pin_names = defaultdict(list)
+        for name in sorted(outlines, key=str.lower):
+            pin_names = outlines[name].pin_names
+            if len(pin_names) >= 2:
+                self._by_pin_names[pin_names].append(name)
+        self._groups = {}
+        self._fits = {}
+
+    def _group(self, pin_names: frozenset):
+        if pin_names not in self._groups:
+            pins = tuple(sorted(pin_names))
+            names = []
+            placed = []
+            for name in self._by_pin_names.get(pin_names, ()):
+                xy = self.outlines[name].pin_xy
+                # pin_xy is sorted by pin name too, so only fully placed outlines compare equal
+                if xy[0::3] == pins:
+                    names.append(name)
+                    placed.append(xy)
+            np = self.np
+            if not names:
+                group = None
+            elif np is not None:
+                coords = np.stack([np.array([xy[1::3] for xy in placed], dtype=float), np.array([xy[2::3] for xy in placed], dtype=float)], axis=-1)
+                coords -= coords.mean(axis=1, keepdims=True)
+                group = (pins, names, coords, (coords * coords).sum(axis=(1, 2)))
+            else:
+                coords = [_centered(list(zip(xy[1::3], xy[2::3]))) for xy in placed]
+                group = (pins, names, coords, [sum(x * x + y * y for x, y in c) for c in coords])
+            self._groups[pin_names] = group
+        return self._groups[pin_names]
+
+    def score(self, pads: dict) -> list:
+        """(RMS pin offset in grid units, outline) for outlines with exactly these pad names, best first."""
+        group = self._group(frozenset(pads))
+        if group is None:
+            return []
+        pins, names, coords, norms = group
+        footprint = _centered([(pads[p][0] / MM_PER_GRID, pads[p][1] / MM_PER_GRID) for p in pins])
+        fp_norm = sum(x * x + y * y for x, y in footprint)
+        k = len(pins)
+        np = self.np
+        if np is not None:
+            # cross[c, i, j] = sum over pins of outline[c] coordinate i * footprint coordinate j
+            cross = np.einsum("cki,kj->cij", coords, np.asarray(footprint))
+            turns = np.einsum("cij,rij->cr", cross, np.asarray(GEOMETRY_ROTATIONS, dtype=float).reshape(4, 2, 2))
+            ssd = norms + fp_norm - 2.0 * turns.max(axis=1)
+            rms = np.sqrt(np.maximum(ssd, 0.0) / k).tolist()
+        else:
+            rms = []
+            for outline_coords, norm in zip(coords, norms):
+                sxx = sxy = syx = syy = 0.0
+                for (ox, oy), (fx, fy) in zip(outline_coords, footprint):
+                    sxx += ox * fx
+                    sxy += ox * fy
+                    syx += oy * fx
+                    syy += oy * fy
+                best = max(a * sxx + b * sxy + c * syx + d * syy for a, b, c, d in GEOMETRY_ROTATIONS)
+                rms.append(math.sqrt(max(norm + fp_norm - 2.0 * best, 0.0) / k))
+        return sorted(zip(rms, names))
+
+    def fits(self, footprint: str) -> list:
+        """Outlines whose pins land on `footprint`'s pads within GEOMETRY_FIT_TOLERANCE, best first."""
+        if footprint not in self._fits:
+            pads = self.footprint_pads.get(footprint)
+            ranked = self.score(pads) if pads and len(pads) >= 2 else []
+            self._fits[footprint] = [(rms, name) for rms, name in ranked if rms <= GEOMETRY_FIT_TOLERANCE]
+        return self._fits[footprint]
+
+
+# Built-in auto-mapping rules, evaluated in order after any user rules from --config.
+# "pattern" is searched in the lower-cased footprint; "outlines" are templates tried
+# in order, where {N} inserts group N and {N:int} inserts it as an integer.
+# Optional "pins" (int or [min, max]) must match the component pin count and
+# optional "pitch_mm" must match the footprint's P<pitch>mm token.
+DEFAULT_AUTO_MAP_RULES = [
     # DIP packages
-    m = re.search(r"dip[-_ ]?(\d+)", fp_lower)
-    if m:
-        name = f"DIP{m.group(1)}"
-        if name in outlines:
-            return name
+    {"name": "dip", "pattern": r"dip[-_ ]?(\d+)", "outlines": ["DIP{1}"]},
     # TO-92
-    if re.search(r"to[-_ ]?92", fp_lower):
-        if "TO92" in outlines:
-            return "TO92"
+    {"name": "to92", "pattern": r"to[-_ ]?92", "outlines": ["TO92"]},
     # PinHeaders and JST 1xN -> SIPN
-    m = re.search(r"1x(\d+)", fp_lower)
-    if m:
-        try:
-            count = int(m.group(1))
-        except ValueError:
-            count = None
-        name = f"SIP{count}" if count is not None else f"SIP{m.group(1)}"
-        if name in outlines:
-            return name
+    {"name": "1xN", "pattern": r"1x(\d+)", "outlines": ["SIP{1:int}"]},
     # Bourns 3296 -> SIP3
-    if "3296" in fp_lower and "SIP3" in outlines:
-        return "SIP3"
+    {"name": "bourns3296", "pattern": r"3296", "outlines": ["SIP3"]},
     # Generic 2-pin passive footprints
-    if fp_lower.startswith("resistor_tht:") or fp_lower.startswith("capacitor_tht:"):
-        for candidate in ("AX2_1", "AX2_2", "AX2_1N"):
-            if candidate in outlines:
-                return candidate
-    return None
+    {"name": "tht-passive", "pattern": r"^(?:resistor_tht|capacitor_tht):", "outlines": ["AX2_1", "AX2_2", "AX2_1N"]},
+]
 
+RULE_TEMPLATE_RE = re.compile(r"\{(\d+)(:int)?\}")
 
-def build_mapping_interactive(current_fp_to_headers, outlines, outlines_by_file, assume_if_exact=True, keep_unknowns=False, auto_map=False, ref_to_pin_count: dict | None = None):
-    mapping = {}
+# Pattern syntax that changes meaning or fails once spliced into the combined
+# regex: backreferences, named groups, group conditionals and global inline flags
+RULE_SPLICE_UNSAFE_RE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+class AutoMapRuleEngine:
+    """
+    Declarative footprint -> outline rules compiled into one combined regex.
+    Every rule becomes an optional lookahead, so a single match call reports all
+    matching rules with their groups; rule order is preserved at evaluation.
+    Patterns that cannot be spliced (see RULE_SPLICE_UNSAFE_RE) are searched
+    on their own instead. Rendered candidates are memoized per footprint string.
+    """
+
+    def __init__(self, rules: list):
+        self.rules = []
+        parts = []
+        for i, rule in enumerate(rules):
+            if not isinstance(rule, dict) or not isinstance(rule.get("pattern"), str):
+                raise ValueError(f"auto-map rule #{i + 1}: 'pattern' string is required")
+            templates = rule.get("outlines", rule.get("outline"))
+            if isinstance(templates, str):
+                templates = [templates]
+            if not isinstance(templates, list) or not templates or not all(isinstance(t, str) for t in templates):
+                raise ValueError(f"auto-map rule #{i + 1}: 'outlines' must be a template or list of templates")
+            try:
+                regex = re.compile(rule["pattern"], re.DOTALL)
+            except re.error as e:
+                raise ValueError(f"auto-map rule #{i + 1}: bad pattern: {e}") from e
+            group_count = regex.groups
+            for template in templates:
+                for m in RULE_TEMPLATE_RE.finditer(template):
+                    if int(m.group(1)) > group_count:
+                        raise ValueError(f"auto-map rule #{i + 1}: template '{template}' refers to a missing group")
+            pins = rule.get("pins")
+            if isinstance(pins, int):
+                pins = (pins, pins)
+            elif pins is not None:
+                if not (isinstance(pins, list) and len(pins) == 2 and all(isinstance(p, int) for p in pins)):
+                    raise ValueError(f"auto-map rule #{i + 1}: 'pins' must be an int or [min, max]")
+                pins = tuple(pins)
+            pitch = rule.get("pitch_mm")
+            if pitch is not None and not isinstance(pitch, (int, float)):
+                raise ValueError(f"auto-map rule #{i + 1}: 'pitch_mm' must be a number")
+            self.rules.append({
+                "name": rule.get("name") or f"rule{i + 1}",
+                "templates": templates,
+                "groups": group_count,
+                "pins": pins,
+                "pitch_mm": pitch,
+                # Set for rules searched on their own rather than through the combined regex
+                "regex": regex if RULE_SPLICE_UNSAFE_RE.search(rule["pattern"]) else None,
+            })
+            if self.rules[-1]["regex"] is None:
+                parts.append(f"(?=(?:.*?(?P<r{i}>{rule['pattern']}))?)")
+        try:
+            self._matcher = re.compile("^" + "".join(parts), re.DOTALL)
+        except re.error:
+            # Some other construct does not splice; every rule still compiles on its own
+            for rule, pattern_rule in zip(self.rules, rules):
+                rule["regex"] = re.compile(pattern_rule["pattern"], re.DOTALL)
+            self._matcher = re.compile("^")
+        self._cache: dict[str, list] = {}
+
+    @classmethod
+    def from_config(cls, config: dict | None) -> "AutoMapRuleEngine":
+        config = config or {}
+        user_rules = config.get("auto_map_rules", [])
+        if not isinstance(user_rules, list):
+            raise ValueError("'auto_map_rules' must be a list")
+        if config.get("replace_builtin_rules"):
+            return cls(user_rules)
+        return cls(user_rules + DEFAULT_AUTO_MAP_RULES)
+
+    def candidates(self, footprint: str) -> list:
+        """Matching rules for a footprint as [(rule, rendered outline names)], in rule order."""
+        cached = self._cache.get(footprint)
+        if cached is not None:
+            return cached
+        fp_lower = footprint.lower()
+        m = self._matcher.match(fp_lower)
+        pitch_m = FOOTPRINT_PITCH_RE.search(fp_lower)
+        pitch = float(pitch_m.group(1)) if pitch_m else None
+        result = []
+        for i, rule in enumerate(self.rules):
+            if rule["regex"] is not None:
+                rule_m = rule["regex"].search(fp_lower)
+                if rule_m is None:
+                    continue
+                groups = [rule_m.group(k) for k in range(rule["groups"] + 1)]
+            else:
+                key = f"r{i}"
+                if m.group(key) is None:
+                    continue
+                base = self._matcher.groupindex[key]
+                groups = [m.group(base + k) for k in range(rule["groups"] + 1)]
+            if rule["pitch_mm"] is not None and (pitch is None or abs(pitch - rule["pitch_mm"]) > 0.005):
+                continue
+            names = [self._render(t, groups) for t in rule["templates"]]
+            result.append((rule, [n for n in names if n]))
+        self._cache[footprint] = result
+        return result
+
+    @staticmethod
+    def _render(template: str, groups: list) -> str | None:
+        def sub(m):
+            value = groups[int(m.group(1))]
+            if value is None:
+                raise LookupError
+            return str(int(value)) if m.group(2) else value
+        try:
+            return RULE_TEMPLATE_RE.sub(sub, template)
+        except (LookupError, ValueError):
+            return None
+
+    def resolve(self, footprint: str, outlines: dict, pin_count: int | None = None) -> str | None:
+        for rule, names in self.candidates(footprint):
+            pins = rule["pins"]
+            if pins is not None and (pin_count is None or not pins[0] <= pin_count <= pins[1]):
+                continue
+            for name in names:
+                if name in outlines:
+                    return name
+        return None
+
+
+_default_rule_engine = None
+
+
+def load_mapping_config(path: str) -> dict:
+    """Read the --config JSON file."""
+    config = json.loads(read_text(path))
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: top level must be a JSON object")
+    return config
+
+
+def auto_map_outline(current_fp: str, outlines: dict, pin_count: int | None = None, engine: AutoMapRuleEngine | None = None) -> str | None:
+    global _default_rule_engine
+    if engine is None:
+        if _default_rule_engine is None:
+            _default_rule_engine = AutoMapRuleEngine(DEFAULT_AUTO_MAP_RULES)
+        engine = _default_rule_engine
+    return engine.resolve(current_fp, outlines, pin_count)
+
+
+def library_fingerprint(outlines: dict) -> str:
+    """
+    Content fingerprint of a catalog, stable across machines. Uses outline names
+    only, so it does not force pin details of a lazy scan to load.
+    """
+    h = hashlib.sha1()
+    for name in sorted(outlines):
+        h.update(name.encode("utf-8") + b"\n")
+    return h.hexdigest()[:16]
+
+
+class MappingDB:
+    """
+    Learned footprint -> outline choices, persisted as JSON (--mapping-db).
+    Each entry remembers the library fingerprint current when it was recorded;
+    an entry whose outline is no longer in the library is only trusted while the
+    fingerprint still matches (e.g. a custom outline name typed at the prompt).
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str | None = None, library: str | None = None):
+        self.path = path
+        self.library = library
+        self.entries: dict[str, dict] = {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str, library: str | None = None) -> "MappingDB":
+        db = cls(path, library)
+        if os.path.exists(path):
+            db.entries = cls.read_entries(path)
+        return db
+
+    @classmethod
+    def read_entries(cls, path: str) -> dict:
+        data = json.loads(read_text(path))
+        if not isinstance(data, dict) or data.get("version") != cls.VERSION:
+            raise ValueError(f"{path}: not a version {cls.VERSION} mapping database")
+        entries = data.get("mappings")
+        if not isinstance(entries, dict):
+            raise ValueError(f"{path}: missing 'mappings' object")
+        return entries
+
+    def lookup(self, footprint: str, outlines: dict, log=print) -> str | None:
+        entry = self.entries.get(footprint)
+        if not entry:
+            return None
+        outline = entry.get("outline")
+        if not isinstance(outline, str):
+            return None
+        if outline in outlines or outline == footprint or entry.get("library") == self.library:
+            return outline
+        log(f"Ignoring learned mapping '{footprint}' -> '{outline}': outline no longer in library.")
+        return None
+
+    def record(self, footprint: str, outline: str) -> None:
+        from datetime import datetime
+
+        entry = self.entries.get(footprint)
+        if entry and entry.get("outline") == outline and entry.get("library") == self.library:
+            return
+        self.entries[footprint] = {
+            "outline": outline,
+            "library": self.library,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.dirty = True
+
+    def merge(self, entries: dict) -> int:
+        """Merge entries from another database, keeping the most recently updated one per footprint."""
+        merged = 0
+        for footprint, entry in entries.items():
+            if not isinstance(entry, dict) or not isinstance(entry.get("outline"), str):
+                continue
+            current = self.entries.get(footprint)
+            if current is None or str(entry.get("updated", "")) > str(current.get("updated", "")):
+                self.entries[footprint] = entry
+                merged += 1
+        if merged:
+            self.dirty = True
+        return merged
+
+    def save(self, path: str | None = None) -> str:
+        path = path or self.path
+        data = {"version": self.VERSION, "mappings": dict(sorted(self.entries.items()))}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write_text(tmp_path, json.dumps(data, indent=2) + "\n")
+        os.replace(tmp_path, path)
+        if path == self.path:
+            self.dirty = False
+        return path
+
+
+NETLIST_STATE_VERSION = 1
+
+
+def netlist_state_path(netlist_path: str, cache_dir: str | None = None) -> str:
+    """Next to the netlist, or in cache_dir keyed by the netlist's absolute path."""
+    if not cache_dir:
+        return f"{netlist_path}.veecad_state.json"
+    key = hashlib.sha1(os.path.abspath(netlist_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"veecad_netlist_state_{key}.json")
+
+
+def load_netlist_state(path: str) -> dict:
+    """
+    Previous run's state for one netlist: {"library", "components"} with
+    components as uuid -> {"footprint", "value", "outline"}. Empty if missing or stale.
+    """
+    try:
+        data = json.loads(read_text(path))
+    except Exception:
+        return {"library": None, "components": {}}
+    if not isinstance(data, dict) or data.get("version") != NETLIST_STATE_VERSION or not isinstance(data.get("components"), dict):
+        return {"library": None, "components": {}}
+    return {"library": data.get("library"), "components": data["components"]}
+
+
+def save_netlist_state(path: str, job: dict, mapping: dict, library: str | None) -> str:
+    """Record every component of `job` with the outline `mapping` gave it."""
+    previous = job.get("state_components", {})
+    components = {}
+    for h in job["headers"]:
+        key = h["uuid"] or h["ref"]
+        footprint = h["footprint"]
+        entry = previous.get(key)
+        if entry is not None and footprint == entry.get("outline") != entry.get("footprint"):
+            # Netlist already carries the outline written last time; keep the KiCad footprint
+            footprint = entry["footprint"]
+        components[key] = {"footprint": footprint, "value": h["value"], "outline": mapping.get(h["footprint"], h["footprint"])}
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {"version": NETLIST_STATE_VERSION, "netlist": os.path.abspath(job["path"]), "library": library, "components": components}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write_text(tmp_path, json.dumps(data, separators=(",", ":")))
+    os.replace(tmp_path, path)
+    return path
+
+
+def diff_netlist_state(job: dict, state: dict, outlines: dict, library: str | None) -> None:
+    """
+    Split a job's components against the previous run's `state`. A component
+    whose uuid and footprint are unchanged (or whose footprint is the outline
+    written last time) keeps its outline without evaluation, provided the outline
+    is still in the library or the library is unchanged. Sets on the job:
+      - state_mapping: footprint -> outline kept from the previous run (identity
+        entries included, so another board's choice cannot override them)
+      - pending_groups: footprint groups with no unchanged component
+      - state_diff: counts of unchanged/new/changed/removed components
+    """
+    previous = state["components"]
+    trust_all = state["library"] is not None and state["library"] == library
+    state_mapping = {}
+    pending = defaultdict(list)
+    counts = {"unchanged": 0, "new": 0, "changed": 0, "removed": 0}
+    seen = set()
+    for h in job["headers"]:
+        key = h["uuid"] or h["ref"]
+        seen.add(key)
+        entry = previous.get(key)
+        if not isinstance(entry, dict):
+            counts["new"] += 1
+            pending[h["footprint"]].append(h)
+            continue
+        outline = entry.get("outline")
+        footprint = h["footprint"]
+        if (
+            isinstance(outline, str)
+            and footprint in (entry.get("footprint"), outline)
+            and (trust_all or outline in outlines or outline == entry.get("footprint"))
+        ):
+            counts["unchanged"] += 1
+            state_mapping.setdefault(footprint, outline)
+            continue
+        counts["changed"] += 1
+        pending[footprint].append(h)
+    counts["removed"] = sum(1 for key in previous if key not in seen)
+    job["state_components"] = previous
+    job["state_mapping"] = state_mapping
+    # A new part on a footprint that unchanged parts already use reuses their outline
+    job["pending_groups"] = {fp: hdrs for fp, hdrs in pending.items() if fp not in state_mapping}
+    job["state_diff"] = counts
+
+
+def job_mapping(job: dict, mapping: dict) -> dict:
+    """`mapping` with the footprints a job kept from its previous run taking precedence."""
+    state_mapping = job.get("state_mapping")
+    return {**mapping, **state_mapping} if state_mapping else mapping
+
+
+def build_mapping_interactive(current_fp_to_headers, outlines, outlines_by_file, assume_if_exact=True, keep_unknowns=False, auto_map=False, ref_to_pin_count: dict | None = None, mapping: dict | None = None, search_index: OutlineSearchIndex | None = None, pin_index: dict | None = None, mapping_db: "MappingDB | None" = None, rule_engine: AutoMapRuleEngine | None = None, geometry: OutlineGeometryIndex | None = None, preference_index: LibraryPreferenceIndex | None = None, choose=None, log=print):
+    """
+    Decide an outline for every footprint group. Pass a `mapping` from a previous
+    board to reuse its decisions; it is extended in place and returned.
+    With a `pin_index` (see index_outlines_by_pins), footprints whose pad set
+    matches exactly one outline are mapped without prompting.
+    A `mapping_db` is consulted before auto-mapping and prompts, and records
+    every new automatic or interactive decision. `rule_engine` replaces the
+    built-in auto-mapping rules. With `geometry`, outlines whose pins fit the
+    board's pads win auto-mapping and are listed first in prompts.
+    `preference_index` (built once per scan) picks the library files to favour in prompts.
+    `choose(footprint, refs, candidates, required_pins)` replaces the prompt: it
+    gets the ranked outline names the prompt would list and returns an outline
+    name, or None to keep the footprint. Progress messages go to `log`.
+    """
+    if mapping is None:
+        mapping = {}
     for current_fp, hdrs in sorted(current_fp_to_headers.items(), key=lambda kv: kv[0].lower()):
         refs = [h["ref"] for h in hdrs]
+        if current_fp in mapping:
+            log(f"Reusing mapping '{current_fp}' -> '{mapping[current_fp]}'.")
+            continue
         if assume_if_exact and current_fp in outlines:
-            print(f"Exact outline found for '{current_fp}', using as-is.")
+            log(f"Exact outline found for '{current_fp}', using as-is.")
             mapping[current_fp] = current_fp
             continue
+        if mapping_db is not None:
+            learned = mapping_db.lookup(current_fp, outlines, log)
+            if learned is not None:
+                log(f"Learned mapping '{current_fp}' -> '{learned}'.")
+                mapping[current_fp] = learned
+                continue
+        if pin_index is not None:
+            by_pins = auto_map_outline_by_pins(hdrs, pin_index)
+            if by_pins:
+                log(f"Auto-mapped '{current_fp}' -> '{by_pins}' (unique pin set).")
+                mapping[current_fp] = by_pins
+                if mapping_db is not None:
+                    mapping_db.record(current_fp, by_pins)
+                continue
+        required_pins = None
+        if ref_to_pin_count:
+            # Use the max pins among refs sharing this fp
+            required_pins = max((ref_to_pin_count.get(r) or 0) for r in refs) or None
+        fits = geometry.fits(current_fp) if geometry is not None else []
         if auto_map:
-            auto = auto_map_outline(current_fp, outlines)
+            auto = auto_map_outline(current_fp, outlines, required_pins, rule_engine)
+            if fits:
+                best = [name for rms, name in fits if rms <= fits[0][0] + 1e-9]
+                # Name rules only break ties between equally good fits
+                if auto not in best and len(best) == 1:
+                    auto = best[0]
+                    log(f"Auto-mapped '{current_fp}' -> '{auto}' (pad geometry, {fits[0][0]:.2f} grid RMS).")
+                    mapping[current_fp] = auto
+                    if mapping_db is not None:
+                        mapping_db.record(current_fp, auto)
+                    continue
             if auto:
-                print(f"Auto-mapped '{current_fp}' -> '{auto}'.")
+                log(f"Auto-mapped '{current_fp}' -> '{auto}'.")
                 mapping[current_fp] = auto
+                if mapping_db is not None:
+                    mapping_db.record(current_fp, auto)
                 continue
         if keep_unknowns:
             # Non-interactive mode for unknowns: keep original footprint
-            print(f"No exact outline for '{current_fp}', keeping original (non-interactive).")
+            log(f"No exact outline for '{current_fp}', keeping original (non-interactive).")
             mapping[current_fp] = current_fp
             continue
-        preferred_files = choose_preferred_lib_files_for_refs(refs, DEFAULT_LIB_DIR, outlines_by_file)
-        required_pins = None
-        if ref_to_pin_count:
-            # Use the max pins among refs sharing this fp
-            required_pins = max((ref_to_pin_count.get(r) or 0) for r in refs) or None
-        selected = pick_outline_interactive(current_fp, refs, outlines, outlines_by_file, preferred_files, required_pins)
+        if preference_index is None:
+            preference_index = LibraryPreferenceIndex(outlines_by_file)
+        preferred_files = choose_preferred_lib_files_for_refs(refs, DEFAULT_LIB_DIR, outlines_by_file, preference_index)
+        if search_index is None:
+            search_index = OutlineSearchIndex(outlines, pin_index)
+        if choose is not None:
+            candidates, _pool_size = outline_candidates(current_fp, outlines, outlines_by_file, preferred_files, required_pins, search_index, fits)
+            selected = choose(current_fp, refs, candidates, required_pins)
+        else:
+            selected = pick_outline_interactive(current_fp, refs, outlines, outlines_by_file, preferred_files, required_pins, search_index, fits)
         if selected is None:
             # Keep as-is
             mapping[current_fp] = current_fp
         else:
             mapping[current_fp] = selected
+        if mapping_db is not None:
+            mapping_db.record(current_fp, mapping[current_fp])
     return mapping
 
 
-def apply_mapping(lines, headers, mapping, dry_run=False):
-    updated_lines = list(lines)
+def plan_mapping_changes(lines, headers, mapping):
+    """
+    Work out what `mapping` changes without copying the netlist. Returns
+    (changes, patches): changes are (line index, old line, new line) for display,
+    patches are (line index, footprint start, footprint end, new footprint).
+    """
     changes = []
+    patches = []
     for h in headers:
         original_fp = h["footprint"]
         new_fp = mapping.get(original_fp, original_fp)
         if new_fp == original_fp:
             continue
         idx = h["line_index"]
-        line = updated_lines[idx]
+        line = lines[idx]
         start, end = h["footprint_span"]
         new_line = line[:start] + new_fp + line[end:]
         changes.append((idx, line.rstrip("\n"), new_line.rstrip("\n")))
-        updated_lines[idx] = new_line
+        patches.append((idx, start, end, new_fp))
+    return changes, patches
+
+
+def apply_mapping(lines, headers, mapping, dry_run=False):
+    changes, patches = plan_mapping_changes(lines, headers, mapping)
+    updated_lines = list(lines)
+    for idx, start, end, new_fp in patches:
+        line = updated_lines[idx]
+        updated_lines[idx] = line[:start] + new_fp + line[end:]
 
     if dry_run:
-        print("\nPlanned changes (line_number: old -> new):")
-        for idx, old, new in changes:
-            print(f"  {idx+1}: {old}")
-            print(f"      -> {new}")
+        print_planned_changes(changes)
     return updated_lines, changes
 
 
+def print_planned_changes(changes):
+    print("\nPlanned changes (line_number: old -> new):")
+    for idx, old, new in changes:
+        print(f"  {idx+1}: {old}")
+        print(f"      -> {new}")
+
+
+def print_mapping_summary(groups, mapping):
+    print("\nMapping summary (footprint -> outline: refs):")
+    for fp in sorted(groups):
+        refs = ", ".join(h["ref"] for h in groups[fp])
+        print(f"  {fp} -> {mapping.get(fp, fp)}: {refs}")
+
+
+def expand_input_paths(patterns) -> list[str]:
+    """Expand -i arguments (plain paths or glob patterns) to absolute paths, keeping order."""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for match in matches:
+            path = os.path.abspath(match)
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def load_netlist(path: str) -> dict:
+    """
+    Read and parse one netlist. Returns a job dict holding lines, headers,
+    footprint groups, pin counts and the parse time; a malformed netlist sets "error".
+    .kicad_sch schematics (with their sub-sheets) and S-expression netlists are
+    accepted too; they have no lines and are not rewritten.
+    """
+    t0 = time.perf_counter()
+    job = {"path": path, "error": None, "format": detect_netlist_format(path)}
+    if job["format"] == "legacy":
+        lines = read_text(path).splitlines(keepends=True)
+        try:
+            headers = parse_netlist_headers(lines)
+        except NetlistParseError as e:
+            headers = []
+            job["error"] = e
+    else:
+        # Schematics and S-expression netlists are only read for a mapping summary
+        lines = None
+        try:
+            if job["format"] == "kicad_sch":
+                headers = parse_schematic_components(path)
+            else:
+                headers = parse_sexpr_netlist_components(path)
+        except (OSError, ValueError) as e:
+            headers = []
+            job["error"] = e
+    job["lines"] = lines
+    job["headers"] = headers
+    job["groups"] = group_by_current_footprint(headers)
+    job["pin_counts"] = compute_component_pin_counts(headers)
+    job["parse_s"] = time.perf_counter() - t0
+    return job
+
+
+def _locate_patches(path: str, lines: list, patches: list):
+    """
+    Turn line/character patches into byte ranges of the file at `path`:
+    a sorted list of (start, end, replacement bytes). Returns None when the
+    file on disk no longer lines up with the parsed lines.
+    """
+    located = []
+    pending = iter(sorted(patches))
+    patch = next(pending, None)
+    offset = 0
+    with open(path, "rb") as f:
+        for idx, raw in enumerate(f):
+            if patch is None:
+                break
+            if idx == patch[0]:
+                _idx, start, end, new_fp = patch
+                try:
+                    text = raw.decode("utf-8")
+                except UnicodeDecodeError:
+                    return None
+                if text[:end] != lines[idx][:end]:
+                    return None
+                located.append((
+                    offset + len(text[:start].encode("utf-8")),
+                    offset + len(text[:end].encode("utf-8")),
+                    new_fp.encode("utf-8"),
+                ))
+                patch = next(pending, None)
+            offset += len(raw)
+    return located if patch is None else None
+
+
+def _write_all(dst, data) -> None:
+    """Write every byte of `data` to an unbuffered file; raw writes may be partial."""
+    view = memoryview(data)
+    while view:
+        n = dst.write(view)
+        if not n:
+            raise OSError(f"short write to {dst.name}")
+        view = view[n:]
+
+
+def _copy_range(src, dst, offset: int, count: int) -> None:
+    """Copy `count` bytes at `offset` of src to dst, in the kernel where the OS allows it."""
+    if hasattr(os, "copy_file_range"):
+        try:
+            while count > 0:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), count, offset)
+                if n == 0:
+                    break
+                offset += n
+                count -= n
+        except OSError:
+            # e.g. EXDEV on older kernels; finish with plain reads below
+            pass
+    src.seek(offset)
+    while count > 0:
+        chunk = src.read(min(count, 1 << 20))
+        if not chunk:
+            raise OSError(f"{src.name} shrank while being rewritten")
+        _write_all(dst, chunk)
+        count -= len(chunk)
+
+
+@contextmanager
+def _atomic_output(path: str):
+    """
+    Binary, unbuffered file that replaces `path` by rename once the block
+    completes; on any error the target is left untouched.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb", buffering=0) as dst:
+            yield dst
+            os.fsync(dst.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_netlist(job: dict, mapping: dict, output_path: str, backup: bool = True, dry_run: bool = False) -> dict:
+    """
+    Apply `mapping` to a loaded netlist job and write it; results are stored on the job.
+    Unchanged bytes are streamed from the source file into a temporary file that
+    atomically replaces the output, so the netlist is never held twice in memory.
+    The parsed lines of the job itself (see load_netlist) still scale with its size.
+    """
+    t0 = time.perf_counter()
+    if job["lines"] is None:
+        job.update(changes=[], output_path=None, backup=None, write_s=0.0)
+        return job
+    changes, patches = plan_mapping_changes(job["lines"], job["headers"], mapping)
+    job["changes"] = changes
+    job["output_path"] = output_path
+    job["backup"] = None
+    if not dry_run:
+        # If output equals input, create backup unless suppressed
+        if output_path == job["path"] and backup:
+            job["backup"] = backup_file(job["path"])
+        located = _locate_patches(job["path"], job["lines"], patches)
+        with _atomic_output(output_path) as dst:
+            if located is None:
+                # The file on disk changed since it was parsed: write the parsed text
+                updated_lines, _changes = apply_mapping(job["lines"], job["headers"], mapping)
+                _write_all(dst, "".join(updated_lines).encode("utf-8"))
+            else:
+                with open(job["path"], "rb") as src:
+                    pos = 0
+                    for start, end, new_bytes in located:
+                        _copy_range(src, dst, pos, start - pos)
+                        _write_all(dst, new_bytes)
+                        pos = end
+                    _copy_range(src, dst, pos, os.fstat(src.fileno()).st_size - pos)
+    job["write_s"] = time.perf_counter() - t0
+    return job
+
+
+class _CodeTable(dict):
+    """name -> integer code; unseen names get the next code on lookup."""
+
+    def __missing__(self, key):
+        code = self[key] = len(self)
+        return code
+
+
+class NetIndex:
+    """
+    Connectivity of a parsed netlist with pads and nets as integer codes in CSR
+    form: component row i owns pad_codes/net_codes[pin_start[i]:pin_start[i + 1]].
+    Indexes built with the same `pads`/`nets` code tables compare by slice.
+    """
+
+    __slots__ = ("refs", "footprints", "keys", "row_by_uuid", "pin_start", "pad_codes", "net_codes", "pads", "nets")
+
+    def __init__(self, components, pads: _CodeTable | None = None, nets: _CodeTable | None = None):
+        self.pads = _CodeTable() if pads is None else pads
+        self.nets = _CodeTable() if nets is None else nets
+        self.refs = [comp["ref"] for comp in components]
+        self.footprints = [comp["footprint"] for comp in components]
+        self.keys = [comp["uuid"] or comp["ref"] for comp in components]
+        self.row_by_uuid = {key: row for row, key in enumerate(self.keys)}
+        self.pin_start = array("i", [0])
+        self.pin_start.extend(itertools.accumulate(len(comp["pads"]) for comp in components))
+        self.pad_codes = array("i", [self.pads[pad] for comp in components for pad, _net in comp["pads"]])
+        self.net_codes = array("i", [self.nets[net] for comp in components for _pad, net in comp["pads"]])
+
+    def pins(self, row: int):
+        """(pad codes, net codes) of one component row."""
+        start, end = self.pin_start[row], self.pin_start[row + 1]
+        return self.pad_codes[start:end], self.net_codes[start:end]
+
+
+def _verify_issue(kind: str, ref: str, message: str) -> dict:
+    return {"kind": kind, "ref": ref, "message": message}
+
+
+def _connectivity_issues(before: NetIndex, after: NetIndex) -> list:
+    issues = []
+    pad_names = list(before.pads)
+    net_names = list(before.nets)
+    for key, row in before.row_by_uuid.items():
+        if key not in after.row_by_uuid:
+            issues.append(_verify_issue("component", before.refs[row], "missing from the rewritten netlist"))
+    for key, row in after.row_by_uuid.items():
+        old_row = before.row_by_uuid.get(key)
+        if old_row is None:
+            issues.append(_verify_issue("component", after.refs[row], "not in the original netlist"))
+            continue
+        pads, nets = after.pins(row)
+        old_pads, old_nets = before.pins(old_row)
+        if (old_pads == pads and old_nets == nets) or sorted(zip(old_pads, old_nets)) == sorted(zip(pads, nets)):
+            continue
+        old_conn = dict(zip(old_pads, old_nets))
+        new_conn = dict(zip(pads, nets))
+        for pad in sorted(old_conn.keys() | new_conn.keys(), key=lambda c: pad_names[c]):
+            old_net, new_net = old_conn.get(pad), new_conn.get(pad)
+            if old_net != new_net:
+                old_text = "unconnected" if old_net is None else f"'{net_names[old_net]}'"
+                new_text = "unconnected" if new_net is None else f"'{net_names[new_net]}'"
+                issues.append(_verify_issue("connectivity", after.refs[row], f"pad {pad_names[pad]}: {old_text} -> {new_text}"))
+    return issues
+
+
+def outline_pin_issues(index: NetIndex, outlines: dict):
+    """
+    Yield (row, kind, message) for components whose footprint is a library
+    outline but whose pads are not all among its pin names ("missing_pads") or
+    whose pad count differs from its pin count ("pin_count").
+    """
+    pad_names = list(index.pads)
+    # (outline, pad codes) -> findings; parts of one footprint share pad sets
+    checked = {}
+    for row, footprint in enumerate(index.footprints):
+        info = outlines.get(footprint)
+        if info is None:
+            continue
+        pads = index.pins(row)[0]
+        if not pads:
+            continue
+        key = (footprint, pads.tobytes())
+        found = checked.get(key)
+        if found is None:
+            found = checked[key] = []
+            if info.pin_names:
+                missing = sorted({pad_names[c] for c in pads} - info.pin_names)
+                if missing:
+                    found.append(("missing_pads", f"pads {', '.join(missing)} not in outline {info.name} pins"))
+            pad_count = len(set(pads))
+            if info.pin_count and pad_count != info.pin_count:
+                found.append(("pin_count", f"{pad_count} pads but outline {info.name} has {info.pin_count} pins"))
+        for kind, message in found:
+            yield row, kind, message
+
+
+def verify_netlist(original, rewritten, outlines: dict) -> dict:
+    """
+    Compare two component lists joined by uuid: every component must keep its
+    pad -> net connections, and a component whose footprint names a library
+    outline must use only pads among the outline's pin names and have as many
+    pads as the outline has pins. Returns counts and a list of issue dicts
+    (kind: "component", "connectivity", "missing_pads" or "pin_count").
+    """
+    t0 = time.perf_counter()
+    before = NetIndex(original)
+    after = NetIndex(rewritten, before.pads, before.nets)
+    # A rewrite keeps component order, so whole arrays usually compare equal in one go
+    same = (
+        before.keys == after.keys
+        and before.pin_start == after.pin_start
+        and before.pad_codes == after.pad_codes
+        and before.net_codes == after.net_codes
+    )
+    issues = [] if same else _connectivity_issues(before, after)
+    for row, kind, message in outline_pin_issues(after, outlines):
+        issues.append(_verify_issue(kind, after.refs[row], message))
+    return {
+        "components": len(after.refs),
+        "pins": len(after.pad_codes),
+        "nets": len(before.nets),
+        "issues": issues,
+        "verify_s": time.perf_counter() - t0,
+    }
+
+
+def verify_job(job: dict, mapping: dict, outlines: dict, dry_run: bool = False) -> dict:
+    """
+    Verify a job after write_netlist(): the written file is re-parsed; for dry
+    runs and inputs that are not rewritten the mapping is applied in memory.
+    The result is stored on the job as "verify".
+    """
+    if job["lines"] is not None and not dry_run:
+        try:
+            with open(job["output_path"], "r", encoding="utf-8") as f:
+                rewritten = parse_netlist_headers(f)
+        except (OSError, UnicodeDecodeError, NetlistParseError) as e:
+            job["verify"] = {"components": 0, "pins": 0, "nets": 0, "verify_s": 0.0,
+                             "issues": [_verify_issue("component", "", f"cannot read {job['output_path']}: {e}")]}
+            return job["verify"]
+    else:
+        rewritten = [dict(h, footprint=mapping.get(h["footprint"], h["footprint"])) for h in job["headers"]]
+    job["verify"] = verify_netlist(job["headers"], rewritten, outlines)
+    return job["verify"]
+
+
+def print_verify_report(job: dict, max_items: int = 30) -> None:
+    report = job["verify"]
+    issues = report["issues"]
+    status = "OK" if not issues else f"{len(issues)} issue(s)"
+    print(
+        f"Verify {job.get('output_path') or job['path']}: {status} "
+        f"({report['components']} components, {report['pins']} pins, {report['nets']} nets, "
+        f"{report['verify_s'] * 1000:.1f} ms)"
+    )
+    for issue in issues[:max_items]:
+        print(f"  [{issue['kind']}] {issue['ref']}: {issue['message']}")
+    if len(issues) > max_items:
+        print(f"  ... and {len(issues) - max_items} more")
+
+
+# Exit status of --check when a footprint is not a usable outline (1 = error, 2 = usage)
+CHECK_FAILED_EXIT = 3
+
+
+def _snapshot_outline(name: str, pin_count: int, pin_names) -> OutlineInfo:
+    info = OutlineInfo(name, [])
+    info._pin_names = set(pin_names)
+    info._pin_count = pin_count
+    info._finalize()
+    return info
+
+
+def check_catalog(args, wanted: set) -> tuple:
+    """
+    The outlines among `wanted` footprint names and the number of library
+    files, for --check. A snapshot taken at the library's current stat
+    signature answers every wanted name it has pins or an absence for, and
+    the full name list settles new names that are not outlines. Anything else
+    scans the library (lazily, building only wanted outlines) and, with
+    --cache-dir, rewrites the snapshot with the new answers added.
+    """
+    signature = snapshot = None
+    if args.cache_dir:
+        signature = signature_digest(library_signature(args.lib_dir))
+        snapshot = load_check_snapshot(args.cache_dir, args.lib_dir, signature)
+    if snapshot is not None:
+        unknown = wanted - snapshot["pins"].keys() - snapshot["missing"]
+        if unknown:
+            names = set(snapshot["names"].split("\n"))
+            if not unknown & names:
+                snapshot["missing"] |= unknown
+                _save_check_snapshot_or_warn(args, signature, snapshot)
+                unknown = set()
+        if not unknown:
+            pins = snapshot["pins"]
+            outlines = {name: _snapshot_outline(name, *pins[name]) for name in wanted if name in pins}
+            return outlines, snapshot["library_files"]
+    # The in-memory index hands back every file's records, so all names are known without building them
+    records = {}
+    outlines, outlines_by_file = scan_veecad_outlines(
+        args.lib_dir,
+        cache_dir=args.cache_dir,
+        jobs=args.jobs,
+        index=records,
+        lazy_pins=True,
+        names=wanted,
+        io_threads=args.io_threads,
+    )
+    if args.cache_dir:
+        pins = snapshot["pins"] if snapshot is not None else {}
+        missing = snapshot["missing"] if snapshot is not None else set()
+        for name, info in outlines.items():
+            pins[name] = [info.pin_count, sorted(info.pin_names)]
+        snapshot = {
+            "library_files": len(outlines_by_file),
+            "names": "\n".join(sorted({record[0] for entry in records.values() for record in entry["outlines"]})),
+            "pins": pins,
+            "missing": missing | (wanted - outlines.keys()),
+        }
+        _save_check_snapshot_or_warn(args, signature, snapshot)
+    return outlines, len(outlines_by_file)
+
+
+def _save_check_snapshot_or_warn(args, signature: str, snapshot: dict) -> None:
+    try:
+        save_check_snapshot(args.cache_dir, args.lib_dir, signature, snapshot)
+    except OSError as e:
+        print(f"Warning: could not write check snapshot to {args.cache_dir}: {e}", file=sys.stderr)
+
+
+def check_netlists(args, parser) -> int:
+    """
+    --check: parse every input and compare its footprints with the outline
+    catalog, without mapping, prompting or writing. Prints a JSON report with
+    one problem per (netlist, footprint, kind) and returns the exit status:
+    0 when every footprint is an outline whose pins fit the pads, else CHECK_FAILED_EXIT.
+    Unreadable inputs and inputs without components are problems too.
+    With --cache-dir, a name-level snapshot of the catalog (check_catalog)
+    answers repeat checks of an unchanged library without reading its index.
+    """
+    input_paths = expand_input_paths(args.input)
+    if not input_paths:
+        parser.error("no netlist matched the given -i/--input arguments")
+
+    def load(path):
+        try:
+            return load_netlist(path)
+        except (OSError, UnicodeDecodeError) as e:
+            return {"path": path, "error": e, "headers": [], "groups": {}}
+
+    jobs = [load(path) for path in input_paths]
+    try:
+        outlines, library_files = check_catalog(args, {fp for job in jobs for fp in job["groups"]})
+    except OSError as e:
+        print(f"Cannot scan library: {e}", file=sys.stderr)
+        return 1
+    netlists = []
+    problems = []
+    for job in jobs:
+        path = job["path"]
+        netlists.append({"path": path, "components": len(job["headers"]), "footprints": len(job["groups"])})
+        if job["error"] is not None:
+            problems.append({"netlist": path, "footprint": None, "kind": "parse_error", "refs": [], "message": str(job["error"])})
+            continue
+        if not job["headers"]:
+            problems.append({"netlist": path, "footprint": None, "kind": "no_components", "refs": [], "message": "no component headers found"})
+            continue
+        for fp, hdrs in sorted(job["groups"].items()):
+            if fp not in outlines:
+                problems.append({
+                    "netlist": path,
+                    "footprint": fp,
+                    "kind": "unknown_outline",
+                    "refs": [h["ref"] for h in hdrs],
+                    "message": f"'{fp}' is not an outline in the library",
+                })
+        index = NetIndex(job["headers"])
+        grouped = {}
+        for row, kind, message in outline_pin_issues(index, outlines):
+            grouped.setdefault((index.footprints[row], kind, message), []).append(index.refs[row])
+        for (fp, kind, message), refs in grouped.items():
+            problems.append({"netlist": path, "footprint": fp, "kind": kind, "refs": refs, "message": message})
+    report = {
+        "ok": not problems,
+        "libraries": args.lib_dir,
+        "library_files": library_files,
+        "netlists": netlists,
+        "problems": problems,
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if not problems else CHECK_FAILED_EXIT
+
+
+class VeeCadLibrary:
+    """
+    A scanned outline catalog for scripts that remap many netlists in one
+    process. Wraps scan_veecad_outlines(); the name, pin and preference indexes
+    are built on first use and dropped when refresh() finds changed .per files,
+    which are then the only ones re-parsed. Scan warnings go to `log`.
+    """
+
+    def __init__(self, lib_dir=DEFAULT_LIB_DIR, cache_dir: str | None = None, jobs: int = 1, lazy_pins: bool = False, io_threads: int = 0, config: dict | None = None, log=None):
+        self.lib_dir = lib_dir
+        self.cache_dir = cache_dir
+        self.jobs = jobs
+        self.lazy_pins = lazy_pins
+        self.io_threads = io_threads
+        self.config = config
+        self.log = log or (lambda message: None)
+        # Raises ValueError for a bad config before the library is scanned
+        self.rule_engine = AutoMapRuleEngine.from_config(config) if config else None
+        LibraryPreferenceIndex.from_config({}, config)
+        self.stats = {}
+        self._records = {}
+        self.reload()
+
+    def reload(self) -> None:
+        # Taken before the scan: a file edited mid-scan is picked up by the next refresh()
+        self._signature = library_signature(self.lib_dir)
+        self.outlines, self.outlines_by_file = scan_veecad_outlines(
+            self.lib_dir,
+            cache_dir=self.cache_dir,
+            jobs=self.jobs,
+            stats=self.stats,
+            index=self._records,
+            lazy_pins=self.lazy_pins,
+            io_threads=self.io_threads,
+            log=self.log,
+        )
+        self._search_index = None
+        self._pin_index = None
+        self._preference_index = None
+        self._fingerprint = None
+
+    def refresh(self) -> bool:
+        """Rescan if any .per file was added, removed or modified; True if it was."""
+        if library_signature(self.lib_dir) == self._signature:
+            return False
+        self.reload()
+        return True
+
+    @property
+    def search_index(self) -> OutlineSearchIndex:
+        if self._search_index is None:
+            # Reuse the pin buckets for pin filters once they exist; building them parses every outline
+            self._search_index = OutlineSearchIndex(self.outlines, self._pin_index)
+        return self._search_index
+
+    @property
+    def pin_index(self) -> dict:
+        if self._pin_index is None:
+            self._pin_index = index_outlines_by_pins(self.outlines)
+        return self._pin_index
+
+    @property
+    def preference_index(self) -> LibraryPreferenceIndex:
+        if self._preference_index is None:
+            self._preference_index = LibraryPreferenceIndex.from_config(self.outlines_by_file, self.config)
+        return self._preference_index
+
+    @property
+    def fingerprint(self) -> str:
+        """library_fingerprint() of the current catalog, e.g. for MappingDB."""
+        if self._fingerprint is None:
+            self._fingerprint = library_fingerprint(self.outlines)
+        return self._fingerprint
+
+    def __len__(self) -> int:
+        return len(self.outlines)
+
+    def __contains__(self, name) -> bool:
+        return name in self.outlines
+
+    def get(self, name: str) -> OutlineInfo | None:
+        return self.outlines.get(name)
+
+    def names(self) -> list[str]:
+        """All outline names, sorted as the prompt lists them."""
+        return list(self.search_index.names)
+
+    def search(self, text: str) -> list[str]:
+        """Names containing `text` (case-insensitive)."""
+        return self.search_index.substring(text)
+
+    def with_prefix(self, prefix: str) -> list[str]:
+        return self.search_index.prefix(prefix)
+
+    def with_pin_count(self, pin_count: int) -> list[str]:
+        return list(self.pin_index["by_pin_count"].get(pin_count, ()))
+
+    def with_pins(self, pin_names) -> list[str]:
+        """Outlines whose pin names are exactly `pin_names`."""
+        return list(self.pin_index["by_pin_signature"].get(frozenset(pin_names), ()))
+
+    def auto_map(self, footprint: str, pin_count: int | None = None) -> str | None:
+        """The outline the auto-mapping rules pick for `footprint`, if any."""
+        return auto_map_outline(footprint, self.outlines, pin_count, self.rule_engine)
+
+    def candidates(self, footprint: str, refs=(), pin_count: int | None = None, k: int = CANDIDATES_SHOWN) -> list[str]:
+        """The outlines the interactive prompt would offer for `footprint`, best first."""
+        preferred_files = choose_preferred_lib_files_for_refs(list(refs), self.lib_dir, self.outlines_by_file, self.preference_index)
+        ranked, _pool_size = outline_candidates(footprint, self.outlines, self.outlines_by_file, preferred_files, pin_count, self.search_index, k=k)
+        return ranked
+
+
+class Netlist:
+    """
+    One parsed netlist, schematic or S-expression netlist (see load_netlist()).
+    Only Eeschema legacy netlists can be rewritten; the others can be resolved
+    and verified. Raises NetlistParseError, OSError or ValueError on bad input.
+    """
+
+    def __init__(self, path: str):
+        self.job = load_netlist(os.path.abspath(path))
+        if self.job["error"] is not None:
+            raise self.job["error"]
+
+    @property
+    def path(self) -> str:
+        return self.job["path"]
+
+    @property
+    def format(self) -> str:
+        return self.job["format"]
+
+    @property
+    def components(self) -> list:
+        """Component headers: dicts with uuid, ref, footprint and value."""
+        return self.job["headers"]
+
+    @property
+    def footprints(self) -> dict:
+        """Footprint -> headers of the components using it."""
+        return self.job["groups"]
+
+    @property
+    def pin_counts(self) -> dict:
+        """Ref -> pad count, where the netlist lists pads."""
+        return self.job["pin_counts"]
+
+    @property
+    def writable(self) -> bool:
+        return self.job["lines"] is not None
+
+    def plan(self, mapping: dict) -> list:
+        """Header changes `mapping` would make, as print_planned_changes() lists them."""
+        if not self.writable:
+            return []
+        changes, _patches = plan_mapping_changes(self.job["lines"], self.job["headers"], mapping)
+        return changes
+
+    def apply(self, mapping: dict) -> tuple:
+        """(updated lines, changes) with `mapping` applied in memory."""
+        if not self.writable:
+            raise ValueError(f"{self.path}: only legacy netlists can be rewritten")
+        return apply_mapping(self.job["lines"], self.job["headers"], mapping)
+
+    def write(self, mapping: dict, output_path: str | None = None, backup: bool = True) -> list:
+        """Write the netlist with `mapping` applied (over itself by default); returns the changes."""
+        if not self.writable:
+            raise ValueError(f"{self.path}: only legacy netlists can be rewritten")
+        write_netlist(self.job, mapping, os.path.abspath(output_path) if output_path else self.path, backup)
+        return self.job["changes"]
+
+    def verify(self, mapping: dict, library: VeeCadLibrary) -> dict:
+        """
+        verify_job() report: the last write() is re-read; before any write the
+        mapping is applied in memory.
+        """
+        return verify_job(self.job, mapping, library.outlines, dry_run=self.job.get("output_path") is None)
+
+
+class MappingResolver:
+    """
+    Decides outlines for Netlist objects the way a batch CLI run does, without
+    stdin or stdout. Exact names, the mapping database, unique pin sets, pad
+    geometry and auto-map rules are tried first; what remains goes to
+    choose(footprint, refs, candidates, required_pins), which returns an outline
+    name or None to keep the footprint. Without `choose` such footprints are kept.
+    Decisions accumulate in `mapping` and are reused for later netlists.
+    """
+
+    def __init__(self, library: VeeCadLibrary, choose=None, assume_if_exact: bool = True, auto_map: bool = True, auto_map_by_pins: bool = False, mapping_db: MappingDB | None = None, footprint_pads: dict | None = None, log=None):
+        self.library = library
+        self.choose = choose
+        self.assume_if_exact = assume_if_exact
+        self.auto_map = auto_map
+        self.auto_map_by_pins = auto_map_by_pins
+        self.mapping_db = mapping_db
+        self.footprint_pads = footprint_pads
+        self.log = log or (lambda message: None)
+        self.mapping = {}
+        self._geometry = None
+
+    @property
+    def geometry(self) -> OutlineGeometryIndex | None:
+        if not self.footprint_pads:
+            return None
+        if self._geometry is None or self._geometry.outlines is not self.library.outlines:
+            self._geometry = OutlineGeometryIndex(self.library.outlines, self.footprint_pads, _import_numpy())
+        return self._geometry
+
+    def resolve(self, netlist: Netlist) -> dict:
+        """Footprint -> outline for every footprint of `netlist`."""
+        library = self.library
+        # Pin buckets first, so a search index built now filters pin counts with them
+        pin_index = library.pin_index if self.auto_map_by_pins else None
+        build_mapping_interactive(
+            netlist.footprints,
+            library.outlines,
+            library.outlines_by_file,
+            assume_if_exact=self.assume_if_exact,
+            keep_unknowns=self.choose is None,
+            auto_map=self.auto_map,
+            ref_to_pin_count=netlist.pin_counts,
+            mapping=self.mapping,
+            search_index=library.search_index if self.choose is not None else None,
+            pin_index=pin_index,
+            mapping_db=self.mapping_db,
+            rule_engine=library.rule_engine,
+            geometry=self.geometry,
+            preference_index=library.preference_index,
+            choose=self.choose,
+            log=self.log,
+        )
+        return {fp: self.mapping[fp] for fp in netlist.footprints}
+
+    def remap(self, netlist: Netlist, output_path: str | None = None, backup: bool = True) -> list:
+        """resolve() and write(); returns the header changes."""
+        return netlist.write(self.resolve(netlist), output_path, backup)
+
+
+class RunProfile:
+    """Wall/CPU time per stage plus counters, reported by --profile."""
+
+    def __init__(self):
+        self.stages: list[tuple[str, float, float]] = []
+        self.counters: dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - wall0, time.process_time() - cpu0))
+
+    def count(self, key: str, n: int = 1) -> None:
+        _count(self.counters, key, n)
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": [{"name": name, "wall_s": wall, "cpu_s": cpu} for name, wall, cpu in self.stages],
+            "counters": dict(self.counters),
+        }
+
+    def print_summary(self) -> None:
+        print("\nProfile (wall ms / cpu ms):")
+        for name, wall, cpu in self.stages:
+            print(f"  {name:20s} {wall * 1000:10.1f} {cpu * 1000:10.1f}")
+        print("Counters:")
+        for key in sorted(self.counters):
+            print(f"  {key:20s} {self.counters[key]:10d}")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Map KiCad netlist footprints to VeeCAD outlines (interactive)",
@@ -572,6 +3128,35 @@ def main():
               - Parses only component header lines of Eeschema legacy netlist (Version 1.1 style).
               - Rewrites only the footprint token on those lines, preserving spaces.
               - Library scanned from: {DEFAULT_LIB_DIR}
+                Several --lib-dir roots are searched in order: an outline in an earlier root
+                shadows the same name in later ones. Byte-identical .per files are parsed once.
+              - Several -i inputs (or a quoted glob) remap all netlists against one library scan;
+                footprint choices made for one board are reused for the others.
+              - --config FILE adds auto-map rules, e.g.
+                {{"auto_map_rules": [{{"pattern": "sod(\\\\d+)", "outlines": ["DIODE{{1}}"], "pins": 2}}]}}
+                Patterns search the lower-cased footprint; {{N}}/{{N:int}} insert group N.
+                'library_groups' / 'ref_prefix_groups' steer which library files prompts favour, e.g.
+                {{"library_groups": {{"diode": {{"path_contains": ["diode"]}}}}, "ref_prefix_groups": {{"D": ["diode"]}}}}
+              - --watch polls the netlists and library (stat only) and reapplies the mapping
+                whenever KiCad re-exports; new footprints are mapped as they appear.
+              - --pcb BOARD.kicad_pcb compares each footprint's pads with outline pin positions
+                on the 0.1" grid (any quarter turn); fitting outlines win --auto-map and are
+                listed first when prompting. numpy speeds this up but is optional.
+              - --incremental stores each component's uuid, footprint, value and outline in
+                NETLIST.veecad_state.json (or in --cache-dir); on the next run only new or
+                changed components are auto-mapped or prompted for.
+              - --verify re-reads every rewritten netlist, joins components by uuid and reports
+                changed pad -> net connections, pads missing from the chosen outline's pin
+                names and pad/pin count mismatches (dry runs check the planned mapping).
+              - --check (for CI) maps and writes nothing: it reports footprints that are not
+                library outlines, or whose pads do not fit the outline, as JSON on stdout and
+                exits {CHECK_FAILED_EXIT}. Use --cache-dir to keep the library scan warm.
+              - A .kicad_sch root schematic (sub-sheets included) or a KiCad S-expression
+                netlist can be given as -i without a legacy export; those inputs are not
+                rewritten, the run prints a footprint -> outline mapping summary instead.
+              - Scripts can import this module and keep one VeeCadLibrary loaded while
+                MappingResolver(library, choose=callback).remap(Netlist(path)) handles each
+                netlist; nothing is prompted or printed.
 
             Interactive commands when choosing outlines:
               - 0 : keep original footprint
@@ -582,60 +3167,415 @@ def main():
             """
         ),
     )
-    parser.add_argument("-i", "--input", required=True, help="Path to KiCad netlist file")
+    parser.add_argument("-i", "--input", required=True, action="append", help="Path or glob of KiCad netlist file(s) or .kicad_sch schematics; repeat for batch mode")
     parser.add_argument("-o", "--output", help="Output path (default: overwrite input)")
-    parser.add_argument("--lib-dir", default=DEFAULT_LIB_DIR, help="VeeCAD library directory")
+    parser.add_argument("--lib-dir", action="append", help="VeeCAD library directory; repeat to add roots, earlier roots take precedence")
+    parser.add_argument("--cache-dir", help="Directory for the persistent outline index (re-parses only changed .per files)")
+    parser.add_argument("--rebuild-index", action="store_true", help="Ignore the existing outline index and rescan the whole library")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Parse library files in N worker processes (0 = all cores, default: 1)")
+    parser.add_argument("--io-threads", type=int, default=0, metavar="N", help="Prefetch library files with N reader threads while parsing (for slow or network mounts; default: 0 = off)")
+    parser.add_argument("--lazy-pins", action="store_true", help="Index outline names first and parse pin details only for outlines that are looked at")
+    parser.add_argument("--check", action="store_true", help=f"Only check that every footprint is a library outline fitting its pads; print JSON, exit {CHECK_FAILED_EXIT} on problems")
     parser.add_argument("--dry-run", action="store_true", help="Show changes without writing")
     parser.add_argument("--no-backup", action="store_true", help="Do not create backup when overwriting input")
     parser.add_argument("--no-auto-exact", action="store_true", help="Do not auto-accept exact outline matches; ask instead")
     parser.add_argument("--keep-unknown", action="store_true", help="Do not prompt for unknown outlines; keep original footprints")
     parser.add_argument("--auto-map", action="store_true", help="Attempt automatic mapping from common KiCad names to VeeCAD outlines")
+    parser.add_argument("--config", metavar="FILE", help="JSON config; 'auto_map_rules' adds rules evaluated before the built-in ones")
+    parser.add_argument("--auto-map-by-pins", action="store_true", help="Map footprints whose pad set matches exactly one outline's pin names, without prompting")
+    parser.add_argument("--mapping-db", metavar="FILE", help="Learned footprint->outline database; consulted before auto-mapping and prompts, updated with new choices")
+    parser.add_argument("--mapping-db-import", metavar="FILE", action="append", help="Merge mappings from another database file (newest entry wins); repeatable")
+    parser.add_argument("--mapping-db-export", metavar="FILE", help="Write the merged mapping database to FILE after the run")
+    parser.add_argument("--pcb", metavar="FILE", action="append", help="KiCad .kicad_pcb whose pad positions are matched against outline pin positions; repeatable")
+    parser.add_argument("--incremental", action="store_true", help="Keep a per-netlist state file; components unchanged since the last run keep their outline without re-mapping")
+    parser.add_argument("--verify", action="store_true", help="Re-read each rewritten netlist and check connectivity and outline pads; exit 1 on problems")
+    parser.add_argument("--watch", action="store_true", help="After the first run, keep the library loaded and remap whenever a netlist is re-exported")
+    parser.add_argument("--watch-interval", type=float, default=0.5, metavar="SECONDS", help="Polling interval for --watch (default: 0.5)")
+    parser.add_argument("--profile", action="store_true", help="Print wall/CPU time per stage and scan/rewrite counters")
+    parser.add_argument("--profile-json", metavar="PATH", help="Write the --profile data as JSON to PATH")
+    parser.add_argument("--profile-pstats", metavar="PATH", help="Run under cProfile and dump stats to PATH (.pstats)")
     args = parser.parse_args()
+    args.lib_dir = args.lib_dir or [DEFAULT_LIB_DIR]
+    if args.jobs < 0:
+        parser.error("--jobs must be >= 0")
+    if args.io_threads < 0:
+        parser.error("--io-threads must be >= 0")
+    if args.watch_interval <= 0:
+        parser.error("--watch-interval must be > 0")
+    if args.check:
+        if args.watch:
+            parser.error("--check cannot be combined with --watch")
+        sys.exit(check_netlists(args, parser))
+
+    profile = RunProfile()
+    profiler = None
+    if args.profile_pstats:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with profile.stage("total"):
+            session = run(args, parser, profile)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_pstats)
+            print(f"Wrote cProfile stats: {args.profile_pstats}")
+    if args.profile:
+        profile.print_summary()
+    if args.profile_json:
+        write_text(args.profile_json, json.dumps(profile.as_dict(), indent=2))
+        print(f"Wrote profile: {args.profile_json}")
+    if args.watch:
+        watch_and_remap(args, session)
+    elif args.verify and any(job["verify"]["issues"] for job in session["jobs"]):
+        sys.exit(1)
 
-    netlist_path = os.path.abspath(args.input)
-    output_path = os.path.abspath(args.output) if args.output else netlist_path
-
-    print(f"Reading netlist: {netlist_path}")
-    text = read_text(netlist_path)
-    lines = text.splitlines(keepends=True)
 
-    headers = parse_netlist_headers(lines)
-    if not headers:
-        print("No component headers found. Is this an Eeschema legacy netlist?")
+def open_mapping_db(args, outlines: dict) -> MappingDB | None:
+    """Load --mapping-db and merge any --mapping-db-import files; None when no option asks for a database."""
+    if not (args.mapping_db or args.mapping_db_import or args.mapping_db_export):
+        return None
+    library = library_fingerprint(outlines)
+    try:
+        if args.mapping_db:
+            mapping_db = MappingDB.load(args.mapping_db, library)
+        else:
+            mapping_db = MappingDB(None, library)
+        for path in args.mapping_db_import or []:
+            merged = mapping_db.merge(MappingDB.read_entries(path))
+            print(f"Imported {merged} mappings from {path}.")
+    except (OSError, ValueError) as e:
+        print(f"Cannot read mapping database: {e}")
         sys.exit(1)
-    current_fp_to_headers = group_by_current_footprint(headers)
-    ref_to_pin_count = compute_component_pin_counts(headers, lines)
+    print(f"Mapping database: {len(mapping_db.entries)} learned footprints.")
+    return mapping_db
 
-    print(f"Found {len(headers)} components with {len(current_fp_to_headers)} unique footprints.")
 
-    print(f"Scanning VeeCAD libraries under: {args.lib_dir}")
-    outlines, outlines_by_file = scan_veecad_outlines(args.lib_dir)
-    print(f"Found {len(outlines)} unique outlines across {len(outlines_by_file)} library files.")
+def save_mapping_db(args, mapping_db: MappingDB | None) -> None:
+    if mapping_db is None:
+        return
+    if mapping_db.path and mapping_db.dirty:
+        print(f"Saved mapping database: {mapping_db.save()}")
+    if args.mapping_db_export:
+        print(f"Exported mapping database: {mapping_db.save(args.mapping_db_export)}")
 
-    mapping = build_mapping_interactive(
-        current_fp_to_headers,
-        outlines,
-        outlines_by_file,
-        assume_if_exact=not args.no_auto_exact,
-        keep_unknowns=args.keep_unknown,
-        auto_map=args.auto_map,
-        ref_to_pin_count=ref_to_pin_count,
-    )
 
-    updated_lines, changes = apply_mapping(lines, headers, mapping, dry_run=args.dry_run)
+def run(args, parser, profile: RunProfile) -> dict:
+    """
+    Remap the netlists named by parsed command-line `args`, recording stages on
+    `profile`. Returns the session state (catalog, indexes, mapping) for --watch.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    input_paths = expand_input_paths(args.input)
+    if not input_paths:
+        parser.error("no netlist matched the given -i/--input arguments")
+    if args.output and len(input_paths) > 1:
+        parser.error("-o/--output can only be used with a single input netlist")
+    batch = len(input_paths) > 1
+
+    config = None
+    if args.config:
+        try:
+            config = load_mapping_config(args.config)
+            # Compile once up front so a bad rule fails before any prompt
+            AutoMapRuleEngine.from_config(config)
+            LibraryPreferenceIndex.from_config({}, config)
+        except (OSError, ValueError) as e:
+            print(f"Invalid config {args.config}: {e}")
+            sys.exit(1)
+
+    for netlist_path in input_paths:
+        print(f"Reading netlist: {netlist_path}")
+    # Parse all netlists concurrently; map() keeps results in input order
+    with profile.stage("parse_netlists"), ThreadPoolExecutor(max_workers=min(len(input_paths), os.cpu_count() or 1)) as pool:
+        jobs = list(pool.map(load_netlist, input_paths))
+    for job in jobs:
+        prefix = f"{os.path.basename(job['path'])}: " if batch else ""
+        if job["error"] is not None:
+            print(f"Malformed netlist {job['path']}: {job['error']}")
+            sys.exit(1)
+        if not job["headers"]:
+            print(f"{prefix}No component headers found. Is this an Eeschema legacy netlist, S-expression netlist or schematic?")
+            sys.exit(1)
+        print(f"{prefix}Found {len(job['headers'])} components with {len(job['groups'])} unique footprints.")
+        profile.count("headers_found", len(job["headers"]))
+
+    footprint_pads = {}
+    if args.pcb:
+        with profile.stage("load_pcb"):
+            for pcb_path in args.pcb:
+                try:
+                    pads = load_pcb_footprint_pads(pcb_path)
+                except (OSError, ValueError) as e:
+                    print(f"Cannot read board {pcb_path}: {e}")
+                    sys.exit(1)
+                print(f"Read pad geometry of {len(pads)} footprints from: {pcb_path}")
+                for fp, fp_pads in pads.items():
+                    footprint_pads.setdefault(fp, fp_pads)
+
+    print(f"Scanning VeeCAD libraries under: {', '.join(args.lib_dir)}")
+    # --watch keeps per-file records in memory so library edits re-parse only changed files
+    library_index = {} if args.watch else None
+    t0 = time.perf_counter()
+    with profile.stage("scan_library"):
+        outlines, outlines_by_file = scan_veecad_outlines(
+            args.lib_dir,
+            cache_dir=args.cache_dir,
+            rebuild_index=args.rebuild_index,
+            jobs=args.jobs,
+            stats=profile.counters,
+            index=library_index,
+            lazy_pins=args.lazy_pins,
+            io_threads=args.io_threads,
+        )
+    scan_s = time.perf_counter() - t0
+    print(f"Found {len(outlines)} unique outlines across {len(outlines_by_file)} library files.")
+
+    # One shared mapping: footprints decided for one board are reused for the next
+    mapping = {}
+    with profile.stage("build_indexes"):
+        # Prompts only happen without --keep-unknown; build the name index once for all boards
+        pin_index = index_outlines_by_pins(outlines) if args.auto_map_by_pins else None
+        search_index = None if args.keep_unknown else OutlineSearchIndex(outlines, pin_index)
+        mapping_db = open_mapping_db(args, outlines)
+        rule_engine = AutoMapRuleEngine.from_config(config) if config else None
+        geometry = OutlineGeometryIndex(outlines, footprint_pads, _import_numpy()) if footprint_pads else None
+        preference_index = LibraryPreferenceIndex.from_config(outlines_by_file, config)
+    library = None
+    if args.incremental:
+        with profile.stage("load_state"):
+            library = mapping_db.library if mapping_db is not None else library_fingerprint(outlines)
+            for job in jobs:
+                job["state_path"] = netlist_state_path(job["path"], args.cache_dir)
+                diff_netlist_state(job, load_netlist_state(job["state_path"]), outlines, library)
+    with profile.stage("mapping"):
+        for job in jobs:
+            if batch:
+                print(f"\n== {job['path']} ==")
+            if args.incremental:
+                diff = job["state_diff"]
+                print(
+                    f"Since last run: {diff['unchanged']} unchanged, {diff['new']} new, {diff['changed']} changed, "
+                    f"{diff['removed']} removed components; {len(job['pending_groups'])} footprints to map."
+                )
+                profile.count("components_unchanged", diff["unchanged"])
+            build_mapping_interactive(
+                job["pending_groups"] if args.incremental else job["groups"],
+                outlines,
+                outlines_by_file,
+                assume_if_exact=not args.no_auto_exact,
+                keep_unknowns=args.keep_unknown,
+                auto_map=args.auto_map,
+                ref_to_pin_count=job["pin_counts"],
+                mapping=mapping,
+                search_index=search_index,
+                pin_index=pin_index,
+                mapping_db=mapping_db,
+                rule_engine=rule_engine,
+                geometry=geometry,
+                preference_index=preference_index,
+            )
+    save_mapping_db(args, mapping_db)
+
+    with profile.stage("rewrite"), ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+        futures = [
+            pool.submit(
+                write_netlist,
+                job,
+                job_mapping(job, mapping),
+                os.path.abspath(args.output) if args.output else job["path"],
+                backup=not args.no_backup,
+                dry_run=args.dry_run,
+            )
+            for job in jobs
+        ]
+        for future in futures:
+            future.result()
+
+    if args.verify:
+        with profile.stage("verify"):
+            for job in jobs:
+                verify_job(job, job_mapping(job, mapping), outlines, dry_run=args.dry_run)
+                profile.count("verify_issues", len(job["verify"]["issues"]))
+
+    if args.incremental and not args.dry_run:
+        with profile.stage("save_state"):
+            for job in jobs:
+                save_netlist_state(job["state_path"], job, job_mapping(job, mapping), library)
+
+    for job in jobs:
+        profile.count("lines_rewritten", len(job["changes"]))
+        if batch:
+            print(f"\n== {job['path']} ==")
+        if job["lines"] is None:
+            print_mapping_summary(job["groups"], job_mapping(job, mapping))
+        elif args.dry_run:
+            print_planned_changes(job["changes"])
+        else:
+            if job["backup"]:
+                print(f"Backup created: {job['backup']}")
+            print(f"Wrote updated netlist: {job['output_path']}")
+            print(f"Changed {len(job['changes'])} component header lines.")
+        if args.verify:
+            print_verify_report(job)
 
     if args.dry_run:
         print("\nDry run completed. No files written.")
-        return
+    if batch:
+        print(f"\nSummary ({len(jobs)} netlists, library scan {scan_s * 1000:.1f} ms):")
+        for job in jobs:
+            if job["lines"] is None:
+                print(f"  {job['path']}: {len(job['headers'])} components, mapping summary only, parse {job['parse_s'] * 1000:.1f} ms")
+                continue
+            print(
+                f"  {job['path']}: {len(job['headers'])} components, "
+                f"{len(job['changes'])} header lines {'to change' if args.dry_run else 'changed'}, "
+                f"parse {job['parse_s'] * 1000:.1f} ms, rewrite {job['write_s'] * 1000:.1f} ms"
+            )
+    return {
+        "jobs": jobs,
+        "outlines": outlines,
+        "outlines_by_file": outlines_by_file,
+        "library_index": library_index,
+        "search_index": search_index,
+        "pin_index": pin_index,
+        "mapping_db": mapping_db,
+        "rule_engine": rule_engine,
+        "geometry": geometry,
+        "config": config,
+        "preference_index": preference_index,
+        "library": library,
+        "mapping": mapping,
+    }
+
+
+def _stat_key(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
 
-    # If output equals input, create backup unless suppressed
-    if output_path == netlist_path and not args.no_backup:
-        b = backup_file(netlist_path)
-        print(f"Backup created: {b}")
 
-    write_text(output_path, "".join(updated_lines))
-    print(f"Wrote updated netlist: {output_path}")
-    print(f"Changed {len(changes)} component header lines.")
+def watch_and_remap(args, session: dict) -> None:
+    """
+    Poll the input netlists and the library with stat calls and remap on change.
+    The catalog and the mapping stay resident; only changed library files are
+    re-parsed and only footprints not seen before go through auto-mapping or prompts.
+    A netlist is only read once its size and mtime held still across two polls,
+    so an export still being written is left alone.
+    """
+    paths = [job["path"] for job in session["jobs"]]
+    outputs = {p: (os.path.abspath(args.output) if args.output else p) for p in paths}
+    seen = {p: _stat_key(p) for p in paths}
+    # path -> stat key observed on the previous poll, while waiting for it to settle
+    settling = {}
+    lib_sig = library_signature(args.lib_dir)
+    mapping = session["mapping"]
+    print(f"\nWatching {len(paths)} netlist(s) and {', '.join(args.lib_dir)} every {args.watch_interval:g}s (Ctrl+C to stop)...")
+    while True:
+        time.sleep(args.watch_interval)
+
+        new_sig = library_signature(args.lib_dir)
+        if new_sig != lib_sig:
+            t0 = time.perf_counter()
+            outlines, outlines_by_file = scan_veecad_outlines(
+                args.lib_dir,
+                cache_dir=args.cache_dir,
+                jobs=args.jobs,
+                index=session["library_index"],
+                lazy_pins=args.lazy_pins,
+                io_threads=args.io_threads,
+            )
+            session["outlines"] = outlines
+            session["outlines_by_file"] = outlines_by_file
+            if session["pin_index"] is not None:
+                session["pin_index"] = index_outlines_by_pins(outlines)
+            if session["search_index"] is not None:
+                session["search_index"] = OutlineSearchIndex(outlines, session["pin_index"])
+            session["preference_index"] = LibraryPreferenceIndex.from_config(outlines_by_file, session["config"])
+            if session["geometry"] is not None:
+                session["geometry"] = OutlineGeometryIndex(outlines, session["geometry"].footprint_pads, session["geometry"].np)
+            if session["mapping_db"] is not None:
+                session["mapping_db"].library = library_fingerprint(outlines)
+            if session["library"] is not None:
+                session["library"] = library_fingerprint(outlines)
+            lib_sig = new_sig
+            print(f"Library changed: {len(outlines)} outlines, rescanned in {(time.perf_counter() - t0) * 1000:.1f} ms.")
+
+        for path in paths:
+            key = _stat_key(path)
+            if key is None or key == seen[path]:
+                settling.pop(path, None)
+                continue
+            if settling.get(path) != key:
+                settling[path] = key
+                continue
+            del settling[path]
+            seen[path] = key
+            t0 = time.perf_counter()
+            job = load_netlist(path)
+            if job["error"] is not None:
+                # An unfinished export fails to parse; its next write changes the stat and retries
+                print(f"{path}: not remapped yet ({job['error']}).")
+                continue
+            if not job["headers"]:
+                print(f"{path}: no component headers found, skipped.")
+                continue
+            groups = job["groups"]
+            if args.incremental:
+                job["state_path"] = netlist_state_path(path, args.cache_dir)
+                diff_netlist_state(job, load_netlist_state(job["state_path"]), session["outlines"], session["library"])
+                groups = job["pending_groups"]
+            # Outline names already written by an earlier remap are not new footprints
+            known = set(mapping) | set(mapping.values())
+            new_groups = {fp: hdrs for fp, hdrs in groups.items() if fp not in known}
+            if new_groups:
+                build_mapping_interactive(
+                    new_groups,
+                    session["outlines"],
+                    session["outlines_by_file"],
+                    assume_if_exact=not args.no_auto_exact,
+                    keep_unknowns=args.keep_unknown,
+                    auto_map=args.auto_map,
+                    ref_to_pin_count=job["pin_counts"],
+                    mapping=mapping,
+                    search_index=session["search_index"],
+                    pin_index=session["pin_index"],
+                    mapping_db=session["mapping_db"],
+                    rule_engine=session["rule_engine"],
+                    geometry=session["geometry"],
+                    preference_index=session["preference_index"],
+                )
+                save_mapping_db(args, session["mapping_db"])
+            remap = job_mapping(job, mapping)
+            # Plan first: a re-export that needs no change is left untouched, without a backup
+            write_netlist(job, remap, outputs[path], dry_run=True)
+            if job["lines"] is not None and not args.dry_run and (job["changes"] or outputs[path] != path):
+                if _stat_key(path) != key:
+                    # KiCad started another export while this one was mapped; remap that one instead
+                    print(f"{path}: changed while remapping, retrying.")
+                    seen[path] = None
+                    continue
+                write_netlist(job, remap, outputs[path], backup=not args.no_backup)
+            if args.incremental and not args.dry_run:
+                save_netlist_state(job["state_path"], job, remap, session["library"])
+            if job["lines"] is None:
+                print_mapping_summary(job["groups"], remap)
+            elif args.dry_run:
+                print_planned_changes(job["changes"])
+            elif outputs[path] == path:
+                # Do not treat our own rewrite as a new export
+                seen[path] = _stat_key(path)
+            print(
+                f"{path}: {len(job['changes'])} header lines remapped "
+                f"in {(time.perf_counter() - t0) * 1000:.1f} ms."
+            )
+            if args.verify:
+                verify_job(job, remap, session["outlines"], dry_run=args.dry_run)
+                print_verify_report(job)
 
 
 if __name__ == "__main__":